@@ -1,5 +1,9 @@
 import numpy as np
 import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from src.entities import Vehicle, BaseStation
 from src.simulation import Simulation
 from src.optimizer import Optimizer
@@ -26,47 +30,60 @@ def main():
     sim = Simulation(vehicles, base_stations)
     optimizer = Optimizer()
 
-    # --- Run Simulation and Collect Logs ---
-    simulation_log = []
+    # --- Run Simulation ---
     time_steps = 50 # Increase steps for a longer animation
     delta_time = 0.5
+    num_vehicles = len(vehicles)
+
+    # Preallocated logs filled in a tight loop; the JSON structure is built only after the run
+    time_log = np.empty(time_steps + 1)
+    v_pos_log = np.empty((time_steps + 1, num_vehicles, 2))
+    assign_log = np.empty((time_steps + 1, num_vehicles), dtype=np.int32)
 
     print(f"Running simulation for {time_steps} steps to generate log...")
 
-    # Add initial state
-    initial_state = sim.get_state()
-    initial_assignments = optimizer.decide_assignments(
-        initial_state['vehicles'], initial_state['base_stations'], initial_state['datarate_matrix']
-    )
-    simulation_log.append({
-        "time": initial_state['time'],
-        "vehicles": [{ "id": v.id, "position": v.position.tolist() } for v in initial_state['vehicles']],
-        "base_stations": [{ "id": bs.id, "position": bs.position.tolist() } for bs in initial_state['base_stations']],
-        "assignments": initial_assignments
-    })
+    for step in range(time_steps + 1):
+        # Step 0 records the initial state
+        if step > 0:
+            sim.step(delta_time)
+        time_log[step] = sim.time
+        v_pos_log[step] = sim.v_pos
+        assign_log[step] = optimizer.decide_assignment_indices(base_stations, sim.datarate_matrix)
+
+    # --- Build Log ---
+    vehicle_ids = [v.id for v in vehicles]
+    bs_ids = [bs.id for bs in base_stations]
+    bs_entries = [{ "id": bs.id, "position": bs.position } for bs in base_stations]
 
-    for step in range(time_steps):
-        sim.step(delta_time)
-        state = sim.get_state()
-        assignments = optimizer.decide_assignments(
-            state['vehicles'], state['base_stations'], state['datarate_matrix']
-        )
-        
-        # Convert numpy arrays to lists for JSON serialization
-        log_entry = {
-            "time": state['time'],
-            "vehicles": [{ "id": v.id, "position": v.position.tolist() } for v in state['vehicles']],
-            "base_stations": [{ "id": bs.id, "position": bs.position.tolist() } for bs in state['base_stations']],
-            "assignments": assignments
+    simulation_log = [
+        {
+            "time": float(time_log[step]),
+            "vehicles": [{ "id": v_id, "position": v_pos_log[step, i] } for i, v_id in enumerate(vehicle_ids)],
+            "base_stations": bs_entries,
+            "assignments": {
+                vehicle_ids[i]: bs_ids[bs_idx]
+                for i, bs_idx in enumerate(assign_log[step].tolist())
+                if bs_idx >= 0
+            }
         }
-        simulation_log.append(log_entry)
+        for step in range(time_steps + 1)
+    ]
 
     # --- Export to JSON ---
     output_path = "prototype/simulation_log.json"
     print(f"Simulation finished. Exporting log to {output_path}...")
 
-    with open(output_path, 'w') as f:
-        json.dump(simulation_log, f, indent=2)
+    # The log is only read by the browser visualizer, so it is written without indentation
+    if orjson is not None:
+        # orjson serializes numpy arrays natively; assignment dicts have int keys
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(
+                simulation_log,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            ))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(simulation_log, f, separators=(',', ':'), default=lambda o: o.tolist())
 
     print("Export complete.")
 
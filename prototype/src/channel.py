@@ -1,6 +1,14 @@
 import numpy as np
 from .entities import Vehicle, BaseStation
 
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+# Below this many vehicle-base station pairs, numexpr's dispatch overhead outweighs its gains
+NUMEXPR_MIN_PAIRS = 10000
+
 def calculate_datarate(vehicle: Vehicle, base_station: BaseStation, p0: float = -30, alpha: float = 2.0) -> float:
     """
     Calculates the estimated data rate between a vehicle and a base station.
@@ -41,3 +49,64 @@ def calculate_datarate(vehicle: Vehicle, base_station: BaseStation, p0: float =
     datarate = max(0, (received_power_dbm - noise_floor_dbm) * 2) # Scale factor of 2 is arbitrary
 
     return datarate
+
+
+def calculate_datarate_matrix(vehicle_positions: np.ndarray, bs_positions: np.ndarray, p0: float = -30, alpha: float = 2.0,
+                              out: np.ndarray = None, diff_buffer: np.ndarray = None) -> np.ndarray:
+    """
+    Vectorized version of calculate_datarate for every vehicle-base station pair.
+
+    Callers that evaluate this every step can pass preallocated buffers, so the
+    computation runs without allocating new arrays.
+
+    Args:
+        vehicle_positions: (N, 2) numpy array of vehicle [x, y] positions.
+        bs_positions: (M, 2) numpy array of base station [x, y] positions.
+        p0: The received power at a reference distance of 1 meter (in dBm).
+        alpha: The path loss exponent.
+        out: Optional (N, M) float array to write the result into.
+        diff_buffer: Optional (N, M, 2) float array for the position differences, same dtype as out.
+
+    Returns:
+        An (N, M) numpy array where element [i, j] is the data rate in Mbps
+        between vehicle i and base station j. Unless out is given, float32 positions
+        produce a float32 result and anything else produces float64.
+    """
+    num_vehicles, num_base_stations = len(vehicle_positions), len(bs_positions)
+    dtype = out.dtype if out is not None else np.result_type(vehicle_positions, bs_positions, np.float32)
+    if out is None:
+        out = np.empty((num_vehicles, num_base_stations), dtype=dtype)
+    if diff_buffer is None:
+        diff_buffer = np.empty((num_vehicles, num_base_stations, 2), dtype=dtype)
+
+    # Squared distances; log10(d) is taken as 0.5 * log10(d^2), which avoids a sqrt pass
+    np.subtract(vehicle_positions[:, None, :], bs_positions[None, :, :], out=diff_buffer)
+    np.square(diff_buffer, out=diff_buffer)
+    distance_sq = np.sum(diff_buffer, axis=-1, out=out)
+    too_close = distance_sq < 1e-12
+
+    # Fold the scalar constants once: datarate = max(0, 2 * (margin - slope * log10(d)))
+    noise_floor_dbm = -95
+    margin_db = p0 - noise_floor_dbm
+    slope_db = 10 * alpha
+
+    if ne is not None and slope_db > 0 and out.size >= NUMEXPR_MIN_PAIRS:
+        # Single fused pass; pairs beyond max_range_m are below the noise floor
+        max_range_sq = 10 ** (2 * margin_db / slope_db)
+        return ne.evaluate(
+            "where(distance_sq < 1e-12, inf, where(distance_sq < max_range_sq, 2 * margin_db - slope_db * log10(distance_sq), 0.0))",
+            local_dict={"distance_sq": distance_sq, "inf": np.inf, "max_range_sq": max_range_sq,
+                        "margin_db": margin_db, "slope_db": slope_db},
+            out=out
+        )
+
+    # Clamp the distance so log10 stays finite; those pairs are overwritten with inf below
+    datarate = out
+    np.maximum(distance_sq, 1e-12, out=datarate)
+    np.log10(datarate, out=datarate)
+    datarate *= -slope_db
+    datarate += 2 * margin_db
+    np.maximum(datarate, 0.0, out=datarate)
+    datarate[too_close] = np.inf
+
+    return datarate
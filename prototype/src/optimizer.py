@@ -2,6 +2,121 @@ from typing import List, Dict
 import numpy as np
 from .entities import Vehicle, BaseStation
 
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    # SciPy is optional; without it every assignment falls back to the greedy strategy
+    linear_sum_assignment = None
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional; without it the kernels below run as plain Python/NumPy
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _assign_in_order(order: np.ndarray, capacities: np.ndarray, assigned: np.ndarray, load: np.ndarray) -> int:
+    """
+    Greedily assigns connections in the given order, updating assigned and load in place.
+
+    Args:
+        order: Flat (vehicle_idx * M + bs_idx) connection indices, best first.
+        capacities: An (M,) int array with the maximum number of vehicles per base station.
+        assigned: An (N,) int array with the assigned base station index per vehicle (-1 if unassigned).
+        load: An (M,) int array with the current number of vehicles per base station.
+
+    Returns:
+        The number of assignments that could still be made (0 once every vehicle or every slot is taken).
+    """
+    num_base_stations = capacities.shape[0]
+    # Negative capacities count as zero free slots, not as fewer slots elsewhere
+    remaining = min(np.sum(assigned == -1), np.sum(np.maximum(capacities - load, 0)))
+
+    for idx in order:
+        if remaining == 0:
+            break
+        v = idx // num_base_stations
+        b = idx % num_base_stations
+        if assigned[v] == -1 and load[b] < capacities[b]:
+            assigned[v] = b
+            load[b] += 1
+            remaining -= 1
+
+    return remaining
+
+
+def _stable_descending(flat: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Sorts ascending flat indices by data rate, best first; ties keep (vehicle, base station) order like list.sort.
+    """
+    return indices[np.argsort(-flat[indices], kind='stable')]
+
+
+def _greedy_assign(datarate_matrix: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+    """
+    Greedy assignment operating on raw arrays.
+
+    Only the best connections (as many as the total capacity) are sorted up front, found
+    with a partial partition instead of a full sort. The remaining connections are sorted
+    only if some vehicles could not be assigned from that prefix.
+
+    Args:
+        datarate_matrix: An (N, M) array of data rates between vehicles and base stations.
+        capacities: An (M,) int array with the maximum number of vehicles per base station.
+
+    Returns:
+        An (N,) int array with the assigned base station index for each vehicle, or -1 if unassigned.
+    """
+    num_vehicles, num_base_stations = datarate_matrix.shape
+    assigned = np.full(num_vehicles, -1, dtype=np.int64)
+    load = np.zeros(num_base_stations, dtype=np.int64)
+
+    flat = datarate_matrix.ravel()
+    k = min(int(np.maximum(capacities, 0).sum()), flat.size)
+    if k <= 0:
+        return assigned
+
+    # Include every tie with the k-th best value so the prefix matches a full stable sort
+    kth_value = np.partition(flat, flat.size - k)[flat.size - k]
+    best = np.flatnonzero(flat >= kth_value)
+    if _assign_in_order(_stable_descending(flat, best), capacities, assigned, load) > 0:
+        rest = np.flatnonzero(flat < kth_value)
+        _assign_in_order(_stable_descending(flat, rest), capacities, assigned, load)
+
+    return assigned
+
+
+def _optimal_assign(datarate_matrix: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+    """
+    Throughput-optimal assignment via the Hungarian algorithm.
+
+    Each base station column is repeated once per capacity slot, turning the capacitated
+    problem into a plain bipartite matching solved by scipy's linear_sum_assignment.
+
+    Args:
+        datarate_matrix: An (N, M) array of finite data rates between vehicles and base stations.
+        capacities: An (M,) int array with the maximum number of vehicles per base station.
+
+    Returns:
+        An (N,) int array with the assigned base station index for each vehicle, or -1 if unassigned.
+    """
+    num_vehicles = datarate_matrix.shape[0]
+    assigned = np.full(num_vehicles, -1, dtype=np.int64)
+
+    # A base station can never serve more than every vehicle, which bounds the expanded width
+    slots = np.clip(capacities, 0, num_vehicles)
+    slot_owner = np.repeat(np.arange(len(capacities)), slots)
+
+    row_ind, col_ind = linear_sum_assignment(datarate_matrix[:, slot_owner], maximize=True)
+    assigned[row_ind] = slot_owner[col_ind]
+
+    return assigned
+
+
 class Optimizer:
     """
     A centralized optimizer that decides the vehicle-to-base station assignments.
@@ -10,7 +125,9 @@ class Optimizer:
         """
         Assigns each vehicle to a base station to maximize total network throughput.
 
-        This method uses a greedy approach:
+        When every vehicle fits within the total base station capacity, the optimal
+        assignment is found with the Hungarian algorithm. Otherwise (or if some data
+        rates are infinite) this method uses a greedy approach:
         1. Find the best possible connection (highest data rate) for each vehicle.
         2. Iterate through all possible connections in descending order of data rate.
         3. Assign a vehicle to a base station if the base station still has capacity.
@@ -24,29 +141,32 @@ class Optimizer:
         Returns:
             A dictionary mapping vehicle_id to assigned base_station_id.
         """
-        num_vehicles = len(vehicles)
-        num_base_stations = len(base_stations)
-
-        # Create a list of all possible connections (vehicle_idx, bs_idx, datarate)
-        possible_connections = []
-        for i in range(num_vehicles):
-            for j in range(num_base_stations):
-                possible_connections.append((i, j, datarate_matrix[i, j]))
+        assigned = self.decide_assignment_indices(base_stations, datarate_matrix)
 
-        # Sort connections by data rate in descending order
-        possible_connections.sort(key=lambda x: x[2], reverse=True)
+        return {
+            vehicles[i].id: base_stations[b].id
+            for i, b in enumerate(assigned)
+            if b >= 0
+        }
 
-        assignments = {}
-        bs_load = {bs.id: 0 for bs in base_stations}
-        bs_capacity = {bs.id: bs.max_capacity for bs in base_stations}
+    def decide_assignment_indices(self, base_stations: List[BaseStation], datarate_matrix: np.ndarray) -> np.ndarray:
+        """
+        Same assignment as decide_assignments, but returned as indices instead of ids.
 
-        for vehicle_idx, bs_idx, _ in possible_connections:
-            vehicle_id = vehicles[vehicle_idx].id
-            bs_id = base_stations[bs_idx].id
+        Args:
+            base_stations: A list of BaseStation objects.
+            datarate_matrix: A 2D numpy array where matrix[i, j] is the data rate
+                             between vehicle i and base station j.
 
-            # If vehicle is not yet assigned and the BS has capacity
-            if vehicle_id not in assignments and bs_load[bs_id] < bs_capacity[bs_id]:
-                assignments[vehicle_id] = bs_id
-                bs_load[bs_id] += 1
+        Returns:
+            An int array where element i is the index of the base station assigned to
+            vehicle i, or -1 if the vehicle could not be assigned.
+        """
+        capacities = np.array([bs.max_capacity for bs in base_stations], dtype=np.int64)
+        datarate_matrix = np.ascontiguousarray(datarate_matrix)
 
-        return assignments
+        if (linear_sum_assignment is not None
+                and datarate_matrix.shape[0] <= capacities.clip(min=0).sum()
+                and np.isfinite(datarate_matrix).all()):
+            return _optimal_assign(datarate_matrix, capacities)
+        return _greedy_assign(datarate_matrix, capacities)
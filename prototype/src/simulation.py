@@ -1,7 +1,7 @@
 from typing import List
 import numpy as np
 from .entities import Vehicle, BaseStation
-from .channel import calculate_datarate
+from .channel import calculate_datarate_matrix
 
 class Simulation:
     """
@@ -18,7 +18,24 @@ class Simulation:
         self.vehicles = vehicles
         self.base_stations = base_stations
         self.time = 0.0
-        self.datarate_matrix = np.zeros((len(vehicles), len(base_stations)))
+
+        # Vehicle state is stored as contiguous (N, 2) arrays so kinematics can be vectorized.
+        # Each Vehicle keeps views into these arrays, so callers still see up-to-date positions.
+        # float32 is plenty for the prototype's path loss model and halves the memory traffic.
+        self.v_pos = np.stack([v.position for v in vehicles]).astype(np.float32)
+        self.v_vel = np.stack([v.velocity for v in vehicles]).astype(np.float32)
+        self.v_ids = np.array([v.id for v in vehicles])
+        for i, vehicle in enumerate(vehicles):
+            vehicle.position = self.v_pos[i]
+            vehicle.velocity = self.v_vel[i]
+        # Scratch buffer for the per-step displacement, so stepping allocates nothing
+        self._displacement = np.empty_like(self.v_pos)
+
+        # Base stations are stationary, so their positions are stacked only once
+        self._bs_pos = np.stack([bs.position for bs in base_stations]).astype(np.float32)
+        self.datarate_matrix = np.zeros((len(vehicles), len(base_stations)), dtype=np.float32)
+        # Scratch buffer for the pairwise position differences used by the data rate kernel
+        self._diff_buffer = np.empty((len(vehicles), len(base_stations), 2), dtype=np.float32)
 
     def step(self, delta_time: float):
         """
@@ -27,9 +44,9 @@ class Simulation:
         Args:
             delta_time: The duration of the time step.
         """
-        # 1. Update vehicle positions
-        for vehicle in self.vehicles:
-            vehicle.update_position(delta_time)
+        # 1. Update vehicle positions in place (the Vehicle views stay valid)
+        np.multiply(self.v_vel, delta_time, out=self._displacement)
+        self.v_pos += self._displacement
 
         # 2. Update the data rate matrix
         self.update_datarate_matrix()
@@ -41,9 +58,7 @@ class Simulation:
         """
         Recalculates the data rate for every vehicle-base station pair.
         """
-        for i, vehicle in enumerate(self.vehicles):
-            for j, bs in enumerate(self.base_stations):
-                self.datarate_matrix[i, j] = calculate_datarate(vehicle, bs)
+        calculate_datarate_matrix(self.v_pos, self._bs_pos, out=self.datarate_matrix, diff_buffer=self._diff_buffer)
 
     def get_state(self):
         """
@@ -1,4 +1,5 @@
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
 from typing import List, Dict
 from .entities import Vehicle, BaseStation
@@ -10,6 +11,11 @@ class Visualizer:
     def __init__(self, terrain_size=(2000, 1000)):
         """
         Initializes the visualizer.
+
+        The static parts of the plot (limits, labels, grid, legend) are drawn once and cached
+        as a background. Dynamic artists are created once and only updated on each frame,
+        then blitted on top of the cached background.
+
         Args:
             terrain_size: A tuple (width, height) for the simulation area.
         """
@@ -17,9 +23,75 @@ class Visualizer:
         plt.ion() # Turn on interactive mode
         self.fig, self.ax = plt.subplots(figsize=(12, 6))
 
+        # Dynamic artists (excluded from the background via animated=True)
+        self._bs_scatter = self.ax.scatter([], [], c='red', marker='s', s=100, label='Base Stations', animated=True)
+        self._v_scatter = self.ax.scatter([], [], c='blue', marker='o', s=50, label='Vehicles', animated=True)
+        self._bs_labels: Dict[int, plt.Text] = {}
+        self._v_labels: Dict[int, plt.Text] = {}
+        self._assignment_lines = LineCollection([], colors='g', linestyles='--', alpha=0.5, animated=True)
+        self._base_stations = None
+        self._bs_positions = np.empty((0, 2))
+        self._bs_by_id: Dict[int, np.ndarray] = {}
+        self.ax.add_collection(self._assignment_lines, autolim=False)
+        self.ax.title.set_animated(True)
+
+        # Static parts of the plot
+        self.ax.set_xlim(0, self.terrain_size[0])
+        self.ax.set_ylim(0, self.terrain_size[1])
+        self.ax.set_xlabel('X Position (m)')
+        self.ax.set_ylabel('Y Position (m)')
+        self.ax.legend()
+        self.ax.grid(True)
+
+        self._background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.fig.canvas.draw()
+
+    def _on_draw(self, event):
+        """
+        Re-caches the static background whenever the full figure is redrawn (e.g. on resize).
+        """
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _label(self, labels: Dict[int, plt.Text], key: int, text: str) -> plt.Text:
+        """
+        Returns the cached text artist for a label, creating it on first use.
+        """
+        if key not in labels:
+            labels[key] = self.ax.text(0, 0, text, animated=True)
+        return labels[key]
+
+    def _animated_artists(self) -> list:
+        """
+        Returns every artist that is redrawn on each frame.
+        """
+        return [
+            self._assignment_lines,
+            self._bs_scatter,
+            self._v_scatter,
+            *self._bs_labels.values(),
+            *self._v_labels.values(),
+            self.ax.title,
+        ]
+
+    def set_base_stations(self, base_stations: List[BaseStation]):
+        """
+        Places the (stationary) base stations once, so update_plot does not rebuild them every frame.
+
+        Args:
+            base_stations: List of BaseStation objects.
+        """
+        self._base_stations = base_stations
+        self._bs_positions = np.array([bs.position for bs in base_stations]).reshape(-1, 2)
+        self._bs_by_id = {bs.id: position for bs, position in zip(base_stations, self._bs_positions)}
+
+        self._bs_scatter.set_offsets(self._bs_positions)
+        for bs, (x, y) in zip(base_stations, self._bs_positions):
+            self._label(self._bs_labels, bs.id, f'BS {bs.id}').set_position((x, y + 20))
+
     def update_plot(self, time: float, vehicles: List[Vehicle], base_stations: List[BaseStation], assignments: Dict[int, int]):
         """
-        Updates and redraws the plot for the current simulation state.
+        Updates the plot for the current simulation state and blits the changed artists.
 
         Args:
             time: The current simulation time.
@@ -27,38 +99,32 @@ class Visualizer:
             base_stations: List of BaseStation objects.
             assignments: A dictionary mapping vehicle_id to assigned base_station_id.
         """
-        self.ax.clear()
-
-        # Plot Base Stations
-        bs_positions = np.array([bs.position for bs in base_stations])
-        self.ax.scatter(bs_positions[:, 0], bs_positions[:, 1], c='red', marker='s', s=100, label='Base Stations')
-        for bs in base_stations:
-            self.ax.text(bs.position[0], bs.position[1] + 20, f'BS {bs.id}')
+        # Base stations are stationary; only place them when a new list is passed in
+        if base_stations is not self._base_stations:
+            self.set_base_stations(base_stations)
 
-        # Plot Vehicles
+        # Update Vehicles
         vehicle_positions = np.array([v.position for v in vehicles])
-        self.ax.scatter(vehicle_positions[:, 0], vehicle_positions[:, 1], c='blue', marker='o', s=50, label='Vehicles')
+        self._v_scatter.set_offsets(vehicle_positions)
         for v in vehicles:
-            self.ax.text(v.position[0], v.position[1] + 20, f'V {v.id}')
+            self._label(self._v_labels, v.id, f'V {v.id}').set_position((v.position[0], v.position[1] + 20))
 
-        # Plot Assignments
-        for vehicle_id, bs_id in assignments.items():
-            vehicle_pos = next((v.position for v in vehicles if v.id == vehicle_id), None)
-            bs_pos = next((bs.position for bs in base_stations if bs.id == bs_id), None)
-            if vehicle_pos is not None and bs_pos is not None:
-                self.ax.plot([vehicle_pos[0], bs_pos[0]], [vehicle_pos[1], bs_pos[1]], 'g--', alpha=0.5)
+        # Update Assignments (all lines live in a single LineCollection)
+        v_by_id = {v.id: v.position for v in vehicles}
+        self._assignment_lines.set_segments([
+            [v_by_id[vehicle_id], self._bs_by_id[bs_id]]
+            for vehicle_id, bs_id in assignments.items()
+            if vehicle_id in v_by_id and bs_id in self._bs_by_id
+        ])
 
-        # Set plot limits and labels
-        self.ax.set_xlim(0, self.terrain_size[0])
-        self.ax.set_ylim(0, self.terrain_size[1])
         self.ax.set_title(f'V2X Network Simulation - Time: {time:.1f}s')
-        self.ax.set_xlabel('X Position (m)')
-        self.ax.set_ylabel('Y Position (m)')
-        self.ax.legend()
-        self.ax.grid(True)
 
-        plt.draw()
-        plt.pause(0.1) # Pause to allow the plot to update
+        # Blit the dynamic artists over the cached background
+        self.fig.canvas.restore_region(self._background)
+        for artist in self._animated_artists():
+            self.fig.draw_artist(artist)
+        self.fig.canvas.blit(self.fig.bbox)
+        self.fig.canvas.flush_events()
 
     def close(self):
         """
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the greedy vehicle-to-base station assignment.
+"""
+import numpy as np
+from src.optimizer import _greedy_assign
+
+
+def _reference_greedy(datarate_matrix: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+    """
+    The original list-based greedy loop: every connection sorted by data rate, best first.
+    """
+    num_vehicles, num_base_stations = datarate_matrix.shape
+    possible_connections = [
+        (i, j, datarate_matrix[i, j]) for i in range(num_vehicles) for j in range(num_base_stations)
+    ]
+    possible_connections.sort(key=lambda x: x[2], reverse=True)
+
+    assigned = np.full(num_vehicles, -1, dtype=np.int64)
+    load = [0] * num_base_stations
+    for vehicle_idx, bs_idx, _ in possible_connections:
+        if assigned[vehicle_idx] == -1 and load[bs_idx] < capacities[bs_idx]:
+            assigned[vehicle_idx] = bs_idx
+            load[bs_idx] += 1
+    return assigned
+
+
+def test_negative_capacity_does_not_block_other_base_stations():
+    """A negative capacity must not reduce the free slots counted for the other base stations."""
+    datarate_matrix = np.array([
+        [9.0, 1.0, 2.0],
+        [8.0, 3.0, 1.0],
+        [7.0, 2.0, 4.0],
+    ])
+    capacities = np.array([-2, 2, 1], dtype=np.int64)
+
+    assigned = _greedy_assign(datarate_matrix, capacities)
+
+    np.testing.assert_array_equal(assigned, [1, 1, 2])
+    np.testing.assert_array_equal(assigned, _reference_greedy(datarate_matrix, capacities))
+
+
+def test_zero_and_negative_capacities_match_reference():
+    """Random matrices with zero and negative capacities give the same result as the original loop."""
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        num_vehicles = int(rng.integers(1, 8))
+        num_base_stations = int(rng.integers(1, 4))
+        datarate_matrix = rng.integers(0, 5, size=(num_vehicles, num_base_stations)).astype(np.float64)
+        capacities = rng.integers(-3, 4, size=num_base_stations).astype(np.int64)
+
+        np.testing.assert_array_equal(
+            _greedy_assign(datarate_matrix, capacities),
+            _reference_greedy(datarate_matrix, capacities),
+        )
+
+
+if __name__ == "__main__":
+    test_negative_capacity_does_not_block_other_base_stations()
+    test_zero_and_negative_capacities_match_reference()
+    print("All optimizer tests passed")
@@ -5,6 +5,8 @@ Building Occlusion Analysis Tool
 import numpy as np
 import matplotlib.pyplot as plt
 import json
+import math
+from numba_compat import njit, prange, NUMBA_AVAILABLE
 
 def point_to_line_distance(point, line_start, line_end):
     """点から線分への最短距離を計算"""
@@ -18,7 +20,7 @@ def point_to_line_distance(point, line_start, line_end):
     
     if dx == 0 and dy == 0:
         # 線分が点の場合
-        return np.sqrt((x0 - x1)**2 + (y0 - y1)**2)
+        return math.hypot(x0 - x1, y0 - y1)
     
     # パラメータt（0-1で線分上の点を表す）
     t = max(0, min(1, ((x0 - x1) * dx + (y0 - y1) * dy) / (dx * dx + dy * dy)))
@@ -28,21 +30,11 @@ def point_to_line_distance(point, line_start, line_end):
     closest_y = y1 + t * dy
     
     # 距離を返す
-    return np.sqrt((x0 - closest_x)**2 + (y0 - closest_y)**2)
+    return math.hypot(x0 - closest_x, y0 - closest_y)
 
-def line_intersects_rectangle(line_start, line_end, rect_center, rect_size):
-    """線分が矩形と交差するかを判定"""
-    x1, y1 = line_start
-    x2, y2 = line_end
-    cx, cy = rect_center[:2]  # x, y座標のみ使用
-    w, h = rect_size[:2]  # width, heightのみ使用
-    
-    # 矩形の境界
-    left = cx - w/2
-    right = cx + w/2
-    top = cy - h/2
-    bottom = cy + h/2
-    
+@njit(cache=True, fastmath=True)
+def _segment_intersects_bounds(x1, y1, x2, y2, left, right, top, bottom):
+    """線分が境界 [left, right] x [top, bottom] の矩形と交差するかを判定（JITカーネル）"""
     # 線分が矩形の境界と交差するかをチェック
     # Liang-Barsky clipping algorithm の簡易版
     
@@ -77,6 +69,112 @@ def line_intersects_rectangle(line_start, line_end, rect_center, rect_size):
     
     return t_min <= t_max
 
+def line_intersects_rectangle(line_start, line_end, rect_center, rect_size):
+    """線分が矩形と交差するかを判定"""
+    x1, y1 = line_start
+    x2, y2 = line_end
+    cx, cy = rect_center[:2]  # x, y座標のみ使用
+    w, h = rect_size[:2]  # width, heightのみ使用
+    
+    # 矩形の境界
+    left = cx - w/2
+    right = cx + w/2
+    top = cy - h/2
+    bottom = cy + h/2
+    
+    # JITカーネルの型特殊化を1つに揃えるためfloatで渡す
+    return bool(_segment_intersects_bounds(
+        float(x1), float(y1), float(x2), float(y2),
+        float(left), float(right), float(top), float(bottom)
+    ))
+
+@njit(cache=True)
+def _sweep_occlusion(starts, ends, rect_center, rect_size):
+    """全ての始点-終点ペアについて遮蔽判定を行う（JITコンパイルされた二重ループ）"""
+    left = rect_center[0] - rect_size[0] / 2
+    right = rect_center[0] + rect_size[0] / 2
+    top = rect_center[1] - rect_size[1] / 2
+    bottom = rect_center[1] + rect_size[1] / 2
+    
+    mask = np.zeros((starts.shape[0], ends.shape[0]), dtype=np.bool_)
+    for i in range(starts.shape[0]):
+        for j in range(ends.shape[0]):
+            mask[i, j] = _segment_intersects_bounds(
+                starts[i, 0], starts[i, 1], ends[j, 0], ends[j, 1],
+                left, right, top, bottom
+            )
+    return mask
+
+def lines_intersect_rectangle(starts, ends, rect_center, rect_size):
+    """複数の線分と矩形の交差をまとめて判定（line_intersects_rectangleのベクトル化版）
+
+    starts: (V, 2) 線分の始点, ends: (B, 2) 線分の終点
+    戻り値: (V, B) のbool配列（[i, j] は starts[i] -> ends[j] の判定結果）
+    """
+    if NUMBA_AVAILABLE:
+        # numbaがあればJITコンパイルされた二重ループの方が一時配列を作らず高速
+        return _sweep_occlusion(
+            np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64),
+            np.asarray(rect_center[:2], dtype=np.float64), np.asarray(rect_size[:2], dtype=np.float64)
+        )
+    
+    starts = np.asarray(starts, dtype=float)[:, None, :]  # (V, 1, 2)
+    ends = np.asarray(ends, dtype=float)[None, :, :]      # (1, B, 2)
+    center = np.asarray(rect_center[:2], dtype=float)
+    half_size = np.asarray(rect_size[:2], dtype=float) / 2
+    
+    # 矩形の境界 [left, top], [right, bottom]
+    low = center - half_size
+    high = center + half_size
+    
+    d = ends - starts  # (V, B, 2)
+    parallel = d == 0
+    
+    # 各軸の進入・退出パラメータ（軸に平行な線分は制約なし）
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (low - starts) / d
+        t2 = (high - starts) / d
+    t_enter = np.where(parallel, -np.inf, np.minimum(t1, t2))
+    t_exit = np.where(parallel, np.inf, np.maximum(t1, t2))
+    
+    # 軸に平行で、かつ矩形の範囲外にある線分は交差しない
+    outside = parallel & ((starts < low) | (starts > high))
+    
+    t_min = np.maximum(0.0, t_enter.max(axis=-1))
+    t_max = np.minimum(1.0, t_exit.min(axis=-1))
+    
+    return (t_min <= t_max) & ~outside.any(axis=-1)
+
+@njit(parallel=True, cache=True)
+def _occlusion_sweep(positions, ends, rect_center, rect_size):
+    """全時刻の遮蔽判定を時刻方向に並列実行する
+
+    positions: (T, V, 2) 各時刻の車両位置, ends: (B, 2) 基地局位置
+    戻り値: (T, V, B) のbool配列
+    """
+    num_times = positions.shape[0]
+    mask = np.zeros((num_times, positions.shape[1], ends.shape[0]), dtype=np.bool_)
+    # 各時刻の判定は独立なので時刻ループをスレッド並列化
+    for t in prange(num_times):
+        mask[t] = _sweep_occlusion(positions[t], ends, rect_center, rect_size)
+    return mask
+
+def sweep_occlusion(positions, ends, rect_center, rect_size):
+    """全時刻・全ペアの遮蔽判定をまとめて行う
+
+    positions: (T, V, 2) 各時刻の車両位置, ends: (B, 2) 基地局位置
+    戻り値: (T, V, B) のbool配列
+    """
+    if NUMBA_AVAILABLE:
+        return _occlusion_sweep(
+            np.asarray(positions, dtype=np.float64), np.asarray(ends, dtype=np.float64),
+            np.asarray(rect_center[:2], dtype=np.float64), np.asarray(rect_size[:2], dtype=np.float64)
+        )
+    return np.stack([
+        lines_intersect_rectangle(step_positions, ends, rect_center, rect_size)
+        for step_positions in positions
+    ])
+
 def analyze_building_occlusion():
     """建物による遮蔽効果を分析"""
     
@@ -104,32 +202,37 @@ def analyze_building_occlusion():
     
     occlusion_events = []
     
-    # 各時刻での遮蔽チェック
-    for step in range(0, 20, 5):  # 5ステップごとに確認
-        time = step * 1.0
+    initial_positions = np.array([v_config["pos"] for v_config in vehicles_config], dtype=float)
+    velocities = np.array([v_config["vel"] for v_config in vehicles_config], dtype=float)
+    bs_positions = np.array([bs["pos"] for bs in base_stations], dtype=float)
+    
+    # 確認する時刻（5ステップごと）の車両位置を一括計算: (T, V, 2)
+    steps = np.arange(0, 20, 5)
+    times = steps * 1.0
+    all_positions = np.clip(initial_positions[None] + velocities[None] * times[:, None, None], 10, 290)
+    
+    # 全時刻の遮蔽と距離をまとめて計算し、表示は後から行う
+    all_occlusions = sweep_occlusion(all_positions, bs_positions, building["pos"], building["size"])
+    offsets = all_positions[:, :, None, :] - bs_positions[None, None, :, :]
+    all_distances = np.hypot(offsets[..., 0], offsets[..., 1])
+    
+    # 各時刻での遮蔽チェック結果
+    for k, step in enumerate(steps.tolist()):
+        time = float(times[k])
         print(f"Time Step {step} (t={time}s):")
         
-        # 車両位置を計算
-        vehicle_positions = {}
-        for v_config in vehicles_config:
-            x = v_config["pos"][0] + v_config["vel"][0] * time
-            y = v_config["pos"][1] + v_config["vel"][1] * time
-            x = max(10, min(290, x))
-            y = max(10, min(290, y))
-            vehicle_positions[v_config["id"]] = [x, y]
+        vehicle_positions = all_positions[k]
+        occlusion_mask = all_occlusions[k]
+        distances = all_distances[k]
         
-        # 各車両-基地局ペアの遮蔽をチェック
-        for v_id, v_pos in vehicle_positions.items():
-            for bs in base_stations:
+        # 各車両-基地局ペアの結果を表示
+        for i, v_config in enumerate(vehicles_config):
+            v_id = v_config["id"]
+            v_pos = vehicle_positions[i].tolist()
+            for j, bs in enumerate(base_stations):
                 bs_pos = bs["pos"]
-                
-                # 車両-基地局間の直線が建物と交差するかチェック
-                is_occluded = line_intersects_rectangle(
-                    v_pos, bs_pos, building["pos"], building["size"]
-                )
-                
-                # 距離計算
-                distance = np.sqrt((v_pos[0] - bs_pos[0])**2 + (v_pos[1] - bs_pos[1])**2)
+                is_occluded = bool(occlusion_mask[i, j])
+                distance = float(distances[i, j])
                 
                 status = "🚫 OCCLUDED" if is_occluded else "✅ Clear"
                 print(f"  {v_id} [{v_pos[0]:.1f}, {v_pos[1]:.1f}] -> {bs['id']} [{bs_pos[0]}, {bs_pos[1]}]: {distance:.1f}m {status}")
@@ -3,21 +3,91 @@
 SIONNA RT公式ドキュメントに基づく
 """
 
-import sionna as sn
-import tensorflow as tf
 import numpy as np
 from typing import List, Tuple
 
+# 底面中心を原点とする単位立方体の8頂点（モジュール読み込み時に一度だけ生成）
+_UNIT_BOX_VERTICES = np.array([
+    # 底面の4頂点
+    [-0.5, -0.5, 0.0],  # 0: 左下後
+    [ 0.5, -0.5, 0.0],  # 1: 右下後
+    [ 0.5,  0.5, 0.0],  # 2: 右下前
+    [-0.5,  0.5, 0.0],  # 3: 左下前
+    # 上面の4頂点
+    [-0.5, -0.5, 1.0],  # 4: 左上後
+    [ 0.5, -0.5, 1.0],  # 5: 右上後
+    [ 0.5,  0.5, 1.0],  # 6: 右上前
+    [-0.5,  0.5, 1.0],  # 7: 左上前
+], dtype=np.float32)
+
+# 三角形フェイス（各面2つの三角形）。全建物で共有するため書き込み不可にする
+_UNIT_BOX_FACES = np.array([
+    # 底面
+    [0, 1, 2], [0, 2, 3],
+    # 上面
+    [4, 6, 5], [4, 7, 6],
+    # 前面
+    [3, 2, 6], [3, 6, 7],
+    # 後面
+    [1, 0, 4], [1, 4, 5],
+    # 左面
+    [0, 3, 7], [0, 7, 4],
+    # 右面
+    [2, 1, 5], [2, 5, 6],
+], dtype=np.int32)
+_UNIT_BOX_FACES.flags.writeable = False
+
+# カスタム建物シーンのXMLテンプレート（建物の中心と拡縮のみ差し替える）
+_SCENE_XML_TEMPLATE = """<scene version="3.0.0">
+    <integrator type="direct"/>
+    
+    <!-- ITU推奨コンクリート材料 -->
+    <bsdf type="twosided" id="concrete_material">
+        <bsdf type="diffuse">
+            <rgb value="0.7 0.6 0.5" name="reflectance"/>
+        </bsdf>
+    </bsdf>
+    
+    <!-- 地面材料 -->
+    <bsdf type="twosided" id="ground_material">
+        <bsdf type="diffuse">
+            <rgb value="0.3 0.8 0.3" name="reflectance"/>
+        </bsdf>
+    </bsdf>
+    
+    <!-- カスタム建物 -->
+    <shape type="cube" id="custom_building">
+        <transform name="to_world">
+            <translate x="{center_x:.1f}" y="{center_y:.1f}" z="{center_z:.1f}"/>
+            <scale x="{scale_x:.1f}" y="{scale_y:.1f}" z="{scale_z:.1f}"/>
+        </transform>
+        <ref name="bsdf" id="concrete_material"/>
+    </shape>
+    
+    <!-- 地面 -->
+    <shape type="rectangle" id="ground">
+        <transform name="to_world">
+            <translate x="150.0" y="150.0" z="0"/>
+            <scale x="150.0" y="150.0" z="1"/>
+        </transform>
+        <ref name="bsdf" id="ground_material"/>
+    </shape>
+</scene>"""
+
 class BuildingPlacer:
     """正しい建物配置を行うクラス"""
     
-    def __init__(self):
+    def __init__(self, init_materials: bool = False):
+        # メッシュ/XML生成だけならSIONNAは不要なので、材料の初期化は明示的に要求された場合のみ行う
         self.concrete_material = None
-        self._init_materials()
+        if init_materials:
+            self._init_materials()
     
     def _init_materials(self):
         """RadioMaterialを初期化"""
         try:
+            import sionna as sn  # 読み込みが重いため必要になった時点でインポート
+            
             # ITU推奨のコンクリート材料パラメータ
             self.concrete_material = sn.rt.RadioMaterial(
                 name="concrete",
@@ -33,44 +103,14 @@ class BuildingPlacer:
             self.concrete_material = None
     
     def create_building_mesh(self, position: List[float], size: List[float]) -> Tuple[np.ndarray, np.ndarray]:
-        """建物の三角メッシュを作成"""
-        x, y, z = position
-        w, d, h = size
-        
-        # 建物の8つの頂点を定義
-        vertices = np.array([
-            # 底面の4頂点
-            [x - w/2, y - d/2, z],      # 0: 左下後
-            [x + w/2, y - d/2, z],      # 1: 右下後
-            [x + w/2, y + d/2, z],      # 2: 右下前
-            [x - w/2, y + d/2, z],      # 3: 左下前
-            # 上面の4頂点
-            [x - w/2, y - d/2, z + h],  # 4: 左上後
-            [x + w/2, y - d/2, z + h],  # 5: 右上後
-            [x + w/2, y + d/2, z + h],  # 6: 右上前
-            [x - w/2, y + d/2, z + h],  # 7: 左上前
-        ])
-        
-        # 三角形フェイスを定義（各面2つの三角形）
-        faces = np.array([
-            # 底面
-            [0, 1, 2], [0, 2, 3],
-            # 上面
-            [4, 6, 5], [4, 7, 6],
-            # 前面
-            [3, 2, 6], [3, 6, 7],
-            # 後面
-            [1, 0, 4], [1, 4, 5],
-            # 左面
-            [0, 3, 7], [0, 7, 4],
-            # 右面
-            [2, 1, 5], [2, 5, 6],
-        ])
-        
-        return vertices, faces
+        """建物の三角メッシュを作成（単位立方体をスケール・平行移動）"""
+        vertices = _UNIT_BOX_VERTICES * np.asarray(size, dtype=np.float32) + np.asarray(position, dtype=np.float32)
+        return vertices, _UNIT_BOX_FACES
     
-    def create_scene_with_custom_building(self, building_position: List[float], building_size: List[float]) -> sn.rt.Scene:
+    def create_scene_with_custom_building(self, building_position: List[float], building_size: List[float]) -> "sn.rt.Scene":
         """カスタム建物を含むシーンを作成"""
+        import sionna as sn  # 読み込みが重いため必要になった時点でインポート
+        
         try:
             # simple_street_canyonをベースシーンとして使用
             scene = sn.rt.load_scene(sn.rt.scene.simple_street_canyon)
@@ -91,9 +131,9 @@ class BuildingPlacer:
         """PLYファイル形式で建物メッシュを保存"""
         vertices, faces = self.create_building_mesh(position, size)
         
-        # PLYファイルのヘッダー
+        # PLYファイルのヘッダー（データ部はバイナリ）
         ply_header = f"""ply
-format ascii 1.0
+format binary_little_endian 1.0
 element vertex {len(vertices)}
 property float x
 property float y
@@ -103,17 +143,17 @@ property list uchar int vertex_indices
 end_header
 """
         
+        # 頂点: float32 x3、フェイス: uchar(頂点数) + int32 x3 のレイアウトで一括変換
+        vertex_data = vertices.astype('<f4', copy=False)
+        face_data = np.empty(len(faces), dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+        face_data['n'] = 3
+        face_data['v'] = faces
+        
         try:
-            with open(filename, 'w') as f:
-                f.write(ply_header)
-                
-                # 頂点データを書き込み
-                for vertex in vertices:
-                    f.write(f"{vertex[0]:.6f} {vertex[1]:.6f} {vertex[2]:.6f}\n")
-                
-                # フェイスデータを書き込み
-                for face in faces:
-                    f.write(f"3 {face[0]} {face[1]} {face[2]}\n")
+            with open(filename, 'wb') as f:
+                f.write(ply_header.encode('ascii'))
+                f.write(vertex_data.tobytes())
+                f.write(face_data.tobytes())
             
             print(f"✅ Building mesh saved to {filename}")
             return filename
@@ -131,41 +171,10 @@ end_header
         center_x, center_y, center_z = x, y, z + h/2
         scale_x, scale_y, scale_z = w/2, d/2, h/2
         
-        xml_content = f"""<scene version="3.0.0">
-    <integrator type="direct"/>
-    
-    <!-- ITU推奨コンクリート材料 -->
-    <bsdf type="twosided" id="concrete_material">
-        <bsdf type="diffuse">
-            <rgb value="0.7 0.6 0.5" name="reflectance"/>
-        </bsdf>
-    </bsdf>
-    
-    <!-- 地面材料 -->
-    <bsdf type="twosided" id="ground_material">
-        <bsdf type="diffuse">
-            <rgb value="0.3 0.8 0.3" name="reflectance"/>
-        </bsdf>
-    </bsdf>
-    
-    <!-- カスタム建物 -->
-    <shape type="cube" id="custom_building">
-        <transform name="to_world">
-            <translate x="{center_x:.1f}" y="{center_y:.1f}" z="{center_z:.1f}"/>
-            <scale x="{scale_x:.1f}" y="{scale_y:.1f}" z="{scale_z:.1f}"/>
-        </transform>
-        <ref name="bsdf" id="concrete_material"/>
-    </shape>
-    
-    <!-- 地面 -->
-    <shape type="rectangle" id="ground">
-        <transform name="to_world">
-            <translate x="150.0" y="150.0" z="0"/>
-            <scale x="150.0" y="150.0" z="1"/>
-        </transform>
-        <ref name="bsdf" id="ground_material"/>
-    </shape>
-</scene>"""
+        xml_content = _SCENE_XML_TEMPLATE.format(
+            center_x=center_x, center_y=center_y, center_z=center_z,
+            scale_x=scale_x, scale_y=scale_y, scale_z=scale_z,
+        )
         
         return xml_content
     
@@ -216,7 +225,7 @@ end_header
 
 def main():
     """メイン関数"""
-    placer = BuildingPlacer()
+    placer = BuildingPlacer(init_materials=True)
     success = placer.test_building_placement()
     
     if success:
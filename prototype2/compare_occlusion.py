@@ -2,20 +2,87 @@
 """
 Compare theoretical occlusion with actual simulation results
 """
-import json
+import sys
+from collections import defaultdict
+from itertools import islice
 import numpy as np
+from numba_compat import njit, prange, NUMBA_AVAILABLE
+from results_io import iter_simulation_steps
 
-def load_simulation_results():
-    """シミュレーション結果を読み込み"""
-    with open('output/simulation_results.json', 'r') as f:
-        return json.load(f)
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+# 5.9GHzと2.4GHzの周波数差による補正項（定数なので一度だけ計算）
+FREQUENCY_TERM = 20 * np.log10(5.9 / 2.4)
+
+# ペアごとのパスロス時系列（時刻順ではなく出現順）
+PATH_LOSS_DTYPE = np.dtype([("time_step", np.int64), ("path_loss", np.float64)])
+
+@njit(cache=True)
+def summarize_occlusion(path_losses, occluded):
+    """遮蔽時・非遮蔽時のパスロス平均とサンプル数を1パスで集計
+
+    戻り値: (遮蔽時の平均, 非遮蔽時の平均, 遮蔽時のサンプル数, 非遮蔽時のサンプル数)
+    """
+    sum_occ = 0.0
+    sum_clear = 0.0
+    n_occ = 0
+    n_clear = 0
+    for k in range(path_losses.shape[0]):
+        if occluded[k]:
+            sum_occ += path_losses[k]
+            n_occ += 1
+        else:
+            sum_clear += path_losses[k]
+            n_clear += 1
+    mean_occ = sum_occ / n_occ if n_occ > 0 else np.nan
+    mean_clear = sum_clear / n_clear if n_clear > 0 else np.nan
+    return mean_occ, mean_clear, n_occ, n_clear
+
+@njit(parallel=True, cache=True)
+def _path_loss_sweep(vehicle_positions, bs_positions):
+    """全時刻・全車両-基地局ペアの距離とパスロスを時刻方向に並列計算（JITカーネル）"""
+    num_steps, num_vehicles = vehicle_positions.shape[0], vehicle_positions.shape[1]
+    num_bs = bs_positions.shape[0]
+    distances = np.empty((num_steps, num_vehicles, num_bs))
+    path_losses = np.empty((num_steps, num_vehicles, num_bs))
+    for t in prange(num_steps):
+        for i in range(num_vehicles):
+            for j in range(num_bs):
+                dx = vehicle_positions[t, i, 0] - bs_positions[j, 0]
+                dy = vehicle_positions[t, i, 1] - bs_positions[j, 1]
+                distance = np.hypot(dx, dy)
+                distances[t, i, j] = distance
+                path_losses[t, i, j] = 40.0 + 20 * np.log10(distance) + FREQUENCY_TERM
+    return distances, path_losses
+
+def theoretical_path_loss(vehicle_positions, bs_positions):
+    """全時刻・全車両-基地局ペアの距離と理論パスロスを計算
+
+    vehicle_positions: (T, V, 2), bs_positions: (B, 2)
+    戻り値: 距離 (T, V, B), 理論的なフリースペースパスロス (T, V, B)
+    """
+    vehicle_positions = np.asarray(vehicle_positions, dtype=np.float64)
+    bs_positions = np.asarray(bs_positions, dtype=np.float64)
+    if NUMBA_AVAILABLE:
+        return _path_loss_sweep(vehicle_positions, bs_positions)
+    
+    diff = vehicle_positions[:, :, None, :] - bs_positions[None, None, :, :]  # (T, V, B, 2)
+    distances = np.hypot(diff[..., 0], diff[..., 1])
+    if ne is not None:
+        # numexprなら対数と加算を一時配列なしの1ループに融合できる
+        path_losses = ne.evaluate("40.0 + 20 * log10(d) + c", local_dict={"d": distances, "c": FREQUENCY_TERM})
+    else:
+        path_losses = 40.0 + 20 * np.log10(distances) + FREQUENCY_TERM
+    return distances, path_losses
 
 def analyze_path_loss_consistency():
     """パスロス値の一貫性を分析"""
-    results = load_simulation_results()
-    
-    print("=== Path Loss Consistency Analysis ===")
-    print()
+    lines = []  # 出力は行単位で溜めて最後にまとめて書き出す
+    lines.append("=== Path Loss Consistency Analysis ===")
+    lines.append("")
     
     # 理論上の遮蔽状況
     expected_occlusions = {
@@ -26,76 +93,68 @@ def analyze_path_loss_consistency():
         ("vehicle_4", "bs_1"): [0, 5, 10, 15],  # 長距離で建物通過
     }
     
-    # 実際のパスロス値を抽出
-    actual_path_losses = {}
+    # 実際のパスロス値を抽出（ステップ単位でストリーミングしながら集約）
+    records = defaultdict(list)
     
-    for step_data in results["simulation_data"]:
+    for step_data in iter_simulation_steps('output/simulation_results.json'):
         time_step = step_data["time_step"]
         
         for pair in step_data["path_loss_pairs"]:
             if pair["link_type"] == "V2I":  # V2I通信のみ分析
-                key = (pair["source"], pair["target"])
-                if key not in actual_path_losses:
-                    actual_path_losses[key] = []
-                actual_path_losses[key].append({
-                    "time_step": time_step,
-                    "path_loss": pair["path_loss_db"]
-                })
+                records[(pair["source"], pair["target"])].append((time_step, pair["path_loss_db"]))
+    
+    actual_path_losses = {
+        key: np.array(values, dtype=PATH_LOSS_DTYPE) for key, values in records.items()
+    }
     
     # 遮蔽の期待される効果を分析
-    print("Expected vs Actual Path Loss Analysis:")
-    print("=" * 60)
+    lines.append("Expected vs Actual Path Loss Analysis:")
+    lines.append("=" * 60)
     
     for pair_key, expected_occlusion_steps in expected_occlusions.items():
         if pair_key in actual_path_losses:
             path_loss_data = actual_path_losses[pair_key]
             
-            print(f"\n{pair_key[0]} -> {pair_key[1]}:")
-            print(f"Expected occlusion at steps: {expected_occlusion_steps}")
+            lines.append(f"\n{pair_key[0]} -> {pair_key[1]}:")
+            lines.append(f"Expected occlusion at steps: {expected_occlusion_steps}")
             
-            # 遮蔽時と非遮蔽時のパスロス値を分類
-            occluded_losses = []
-            clear_losses = []
+            # 遮蔽時と非遮蔽時のパスロス値を分類して集計
+            path_losses = path_loss_data["path_loss"]
+            time_steps = path_loss_data["time_step"]
+            occluded = np.isin(time_steps, expected_occlusion_steps)
+            avg_occluded, avg_clear, n_occluded, n_clear = summarize_occlusion(path_losses, occluded)
             
-            for data in path_loss_data:
-                if data["time_step"] in expected_occlusion_steps:
-                    occluded_losses.append(data["path_loss"])
-                else:
-                    clear_losses.append(data["path_loss"])
-            
-            if occluded_losses and clear_losses:
-                avg_occluded = np.mean(occluded_losses)
-                avg_clear = np.mean(clear_losses)
+            if n_occluded > 0 and n_clear > 0:
                 difference = avg_occluded - avg_clear
                 
-                print(f"  Clear path loss:    {avg_clear:.1f} dB (n={len(clear_losses)})")
-                print(f"  Occluded path loss: {avg_occluded:.1f} dB (n={len(occluded_losses)})")
-                print(f"  Difference:         {difference:.1f} dB")
+                lines.append(f"  Clear path loss:    {avg_clear:.1f} dB (n={n_clear})")
+                lines.append(f"  Occluded path loss: {avg_occluded:.1f} dB (n={n_occluded})")
+                lines.append(f"  Difference:         {difference:.1f} dB")
                 
                 if abs(difference) < 5:
-                    print(f"  ⚠️  WARNING: Difference too small! Building occlusion may not be working.")
+                    lines.append(f"  ⚠️  WARNING: Difference too small! Building occlusion may not be working.")
                 elif difference > 0:
-                    print(f"  ✅ Occlusion effect detected (higher path loss when occluded)")
+                    lines.append(f"  ✅ Occlusion effect detected (higher path loss when occluded)")
                 else:
-                    print(f"  ❓ Unexpected: lower path loss when occluded")
+                    lines.append(f"  ❓ Unexpected: lower path loss when occluded")
             else:
-                print(f"  ⚠️  Insufficient data for comparison")
+                lines.append(f"  ⚠️  Insufficient data for comparison")
             
             # 詳細なステップ別表示
-            print(f"  Step-by-step breakdown:")
-            for data in sorted(path_loss_data, key=lambda x: x["time_step"]):
+            lines.append(f"  Step-by-step breakdown:")
+            for data in np.sort(path_loss_data, order="time_step", kind="stable"):
                 status = "🚫 Occluded" if data["time_step"] in expected_occlusion_steps else "✅ Clear"
-                print(f"    Step {data['time_step']:2d}: {data['path_loss']:5.1f} dB {status}")
+                lines.append(f"    Step {data['time_step']:2d}: {data['path_loss']:5.1f} dB {status}")
     
+    sys.stdout.write("\n".join(lines) + "\n")
     return actual_path_losses
 
 def compare_distance_vs_occlusion():
     """距離とパスロスの関係を分析（遮蔽効果を考慮）"""
-    results = load_simulation_results()
-    
-    print("\n" + "=" * 60)
-    print("Distance vs Path Loss Analysis")
-    print("=" * 60)
+    lines = []  # 出力は行単位で溜めて最後にまとめて書き出す
+    lines.append("\n" + "=" * 60)
+    lines.append("Distance vs Path Loss Analysis")
+    lines.append("=" * 60)
     
     # 車両配置から距離を計算
     vehicles_config = [
@@ -110,36 +169,39 @@ def compare_distance_vs_occlusion():
         {"id": "bs_2", "pos": [220, 180]}
     ]
     
-    for step_idx, step_data in enumerate(results["simulation_data"][:5]):  # 最初の5ステップ
-        print(f"\nTime Step {step_idx}:")
-        
-        # 車両位置を計算
-        vehicle_positions = {}
-        for v_config in vehicles_config:
-            time = step_idx * 1.0
-            x = v_config["pos"][0] + v_config["vel"][0] * time
-            y = v_config["pos"][1] + v_config["vel"][1] * time
-            x = max(10, min(290, x))
-            y = max(10, min(290, y))
-            vehicle_positions[v_config["id"]] = [x, y]
+    steps_data = list(islice(iter_simulation_steps('output/simulation_results.json'), 5))  # 最初の5ステップ
+    
+    # 車両位置を全ステップ分まとめて計算: (T, V, 2)
+    initial_positions = np.array([v_config["pos"] for v_config in vehicles_config], dtype=np.float64)
+    velocities = np.array([v_config["vel"] for v_config in vehicles_config], dtype=np.float64)
+    times = np.arange(len(steps_data), dtype=np.float64)[:, None, None] * 1.0
+    vehicle_positions = np.clip(initial_positions[None] + velocities[None] * times, 10, 290)
+    bs_positions = np.array([bs["pos"] for bs in base_stations], dtype=np.float64)
+    
+    # 距離と理論パスロスを一括計算
+    distances, theoretical_pls = theoretical_path_loss(vehicle_positions, bs_positions)
+    
+    vehicle_index = {v_config["id"]: i for i, v_config in enumerate(vehicles_config)}
+    bs_index = {bs["id"]: j for j, bs in enumerate(base_stations)}
+    
+    for step_idx, step_data in enumerate(steps_data):
+        lines.append(f"\nTime Step {step_idx}:")
         
         # V2Iペアの距離とパスロスを比較
         for pair in step_data["path_loss_pairs"]:
             if pair["link_type"] == "V2I":
                 vehicle_id = pair["source"]
                 bs_id = pair["target"]
+                i, j = vehicle_index[vehicle_id], bs_index[bs_id]
                 
-                # 距離を計算
-                v_pos = vehicle_positions[vehicle_id]
-                bs_pos = next(bs["pos"] for bs in base_stations if bs["id"] == bs_id)
-                distance = np.sqrt((v_pos[0] - bs_pos[0])**2 + (v_pos[1] - bs_pos[1])**2)
-                
-                # 理論的なフリースペースパスロス
-                theoretical_pl = 40.0 + 20 * np.log10(distance) + 20 * np.log10(5.9/2.4)
+                distance = distances[step_idx, i, j]
+                theoretical_pl = theoretical_pls[step_idx, i, j]
                 actual_pl = pair["path_loss_db"]
                 difference = actual_pl - theoretical_pl
                 
-                print(f"  {vehicle_id} -> {bs_id}: {distance:5.1f}m, theoretical: {theoretical_pl:5.1f}dB, actual: {actual_pl:5.1f}dB, diff: {difference:+5.1f}dB")
+                lines.append(f"  {vehicle_id} -> {bs_id}: {distance:5.1f}m, theoretical: {theoretical_pl:5.1f}dB, actual: {actual_pl:5.1f}dB, diff: {difference:+5.1f}dB")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     actual_losses = analyze_path_loss_consistency()
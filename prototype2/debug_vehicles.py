@@ -2,6 +2,7 @@
 """
 Vehicle positioning debug script
 """
+import sys
 import numpy as np
 
 # Vehicle configurations
@@ -21,40 +22,46 @@ base_stations = [
 # Building
 building = {"pos": [150, 120], "size": [50, 30]}
 
-print("=== Vehicle Distance Analysis ===")
-print()
+lines = []  # Collect the report and write it out in one go
+lines.append("=== Vehicle Distance Analysis ===")
+lines.append("")
 
-for step in [0, 10, 19]:  # Check initial, middle, and final positions
-    print(f"Time Step {step}:")
+steps = [0, 10, 19]  # Check initial, middle, and final positions
+
+# Stack the configuration into arrays once
+pos = np.array([v_config["pos"] for v_config in vehicles_config], dtype=float)  # (V, 2)
+vel = np.array([v_config["vel"] for v_config in vehicles_config], dtype=float)  # (V, 2)
+bs_pos = np.array([bs["pos"] for bs in base_stations], dtype=float)            # (B, 2)
+
+# Vehicle positions at every checked step, kept within bounds [10, 290] x [10, 290]
+t = np.array(steps, dtype=float).reshape(-1, 1, 1) * 1.0  # 1 second per step
+positions = np.clip(pos[None] + vel[None] * t, 10, 290)  # (T, V, 2)
+
+# Distance from every vehicle to every base station
+offsets = positions[:, :, None, :] - bs_pos[None, None, :, :]  # (T, V, B, 2)
+distances = np.hypot(offsets[..., 0], offsets[..., 1])         # (T, V, B)
+
+# Building overlap check
+building_min = np.array(building["pos"]) - np.array(building["size"]) / 2
+building_max = np.array(building["pos"]) + np.array(building["size"]) / 2
+overlaps = np.all((building_min <= positions) & (positions <= building_max), axis=-1)  # (T, V)
+
+for k, step in enumerate(steps):
+    lines.append(f"Time Step {step}:")
     
-    for v_config in vehicles_config:
-        # Calculate vehicle position at this step
-        time = step * 1.0  # 1 second per step
-        x = v_config["pos"][0] + v_config["vel"][0] * time
-        y = v_config["pos"][1] + v_config["vel"][1] * time
+    for i, v_config in enumerate(vehicles_config):
+        x, y = positions[k, i]
+        lines.append(f"  {v_config['id']}: [{x:.1f}, {y:.1f}]")
         
-        # Keep within bounds [10, 290] x [10, 290]
-        x = max(10, min(290, x))
-        y = max(10, min(290, y))
+        for j, bs in enumerate(base_stations):
+            lines.append(f"    Distance to {bs['id']}: {distances[k, i, j]:.1f}m")
         
-        print(f"  {v_config['id']}: [{x:.1f}, {y:.1f}]")
+        if overlaps[k, i]:
+            lines.append(f"    ⚠️  Vehicle overlaps with building!")
         
-        # Calculate distance to each base station
-        for bs in base_stations:
-            dist = np.sqrt((x - bs["pos"][0])**2 + (y - bs["pos"][1])**2)
-            print(f"    Distance to {bs['id']}: {dist:.1f}m")
-        
-        # Check building occlusion
-        building_min_x = building["pos"][0] - building["size"][0]/2
-        building_max_x = building["pos"][0] + building["size"][0]/2
-        building_min_y = building["pos"][1] - building["size"][1]/2
-        building_max_y = building["pos"][1] + building["size"][1]/2
-        
-        if (building_min_x <= x <= building_max_x and 
-            building_min_y <= y <= building_max_y):
-            print(f"    ⚠️  Vehicle overlaps with building!")
-        
-        print()
+        lines.append("")
     
-    print("-" * 50)
-    print()
\ No newline at end of file
+    lines.append("-" * 50)
+    lines.append("")
+
+sys.stdout.write("\n".join(lines) + "\n")
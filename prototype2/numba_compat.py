@@ -0,0 +1,17 @@
+"""
+Numba compatibility helpers
+numbaがインストールされていない環境では、JIT対象の関数を通常のPython関数として実行する
+"""
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """numba.njitの代替（デコレートした関数をそのまま返す）"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
@@ -0,0 +1,36 @@
+"""
+Simulation results I/O helpers
+シミュレーション結果ファイル（simulation_results.json）をステップ単位で読み込む
+"""
+
+import json
+from typing import Any, Dict, Iterator
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def load_results(results_path: str) -> Dict[str, Any]:
+    """結果ファイル全体を読み込む（orjsonがあればバイト列のまま解析し、無ければjson.load）"""
+    with open(results_path, 'rb') as f:
+        if orjson is not None:
+            return orjson.loads(f.read())
+        return json.load(f)
+
+def iter_simulation_steps(results_path: str) -> Iterator[Dict[str, Any]]:
+    """結果ファイルの simulation_data のステップを1つずつ読み込むジェネレータ
+    
+    ijsonがあればファイル全体を展開せずにストリーミングで読み込み、無ければload_resultsで一括で読み込む
+    （V2V行列の対角はnullで書き出されるため、結果ファイルは標準のJSONとして読める）
+    """
+    if ijson is not None:
+        with open(results_path, 'rb') as f:
+            yield from ijson.items(f, 'simulation_data.item', use_float=True)
+    else:
+        yield from load_results(results_path)["simulation_data"]
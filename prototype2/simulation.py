@@ -7,33 +7,212 @@ import sionna as sn
 import tensorflow as tf
 import numpy as np
 import json
-from typing import List, Dict, Tuple, Any
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain, compress
+from typing import List, Dict, Tuple, Any, Optional
 from dataclasses import dataclass
+from numba_compat import njit, NUMBA_AVAILABLE
+from results_io import iter_simulation_steps
+from visualization import V2XVisualizer
 
-@dataclass
+def _update_path_loss_stats(stats: Dict[str, Dict[str, float]], path_loss_pairs: List[Dict[str, Any]]):
+    """ペアごとのパスロス統計（最小・最大・合計・件数）を1ステップ分だけ更新"""
+    for pair in path_loss_pairs:
+        pair_key = f"{pair['source']}-{pair['target']}"
+        path_loss = pair["path_loss_db"]
+        pair_stats = stats.get(pair_key)
+        if pair_stats is None:
+            stats[pair_key] = {"min": path_loss, "max": path_loss, "sum": path_loss, "count": 1}
+        else:
+            pair_stats["min"] = min(pair_stats["min"], path_loss)
+            pair_stats["max"] = max(pair_stats["max"], path_loss)
+            pair_stats["sum"] += path_loss
+            pair_stats["count"] += 1
+
+def _clear_v2v_diagonal(v2v_rows: List[List[Any]]):
+    """V2V行列の対角（同一車両、パスロスは無限大）をNone（JSONのnull）に置き換える
+    
+    InfinityはJSONの標準外で、ijsonやorjsonなどのパーサーが読めないため。
+    行列として使う側は np.array(rows, dtype=float) でNaNにしてから対角を無限大に戻す
+    """
+    for i, row in enumerate(v2v_rows):
+        row[i] = None
+
+# シナリオの構成要素はセットアップ後に変更しないため、不変かつ__slots__付きで定義する
+@dataclass(frozen=True, slots=True)
 class Vehicle:
     """車両の定義"""
     id: str
-    initial_position: List[float]
-    velocity: List[float]  # [vx, vy] m/s
+    initial_position: Tuple[float, ...]
+    velocity: Tuple[float, ...]  # (vx, vy) m/s
     antenna_height: float = 1.5
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class BaseStation:
     """基地局の定義"""
     id: str
-    position: List[float]
+    position: Tuple[float, ...]
     antenna_height: float = 10.0
     max_capacity: int = 10
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Building:
     """建物の定義"""
     id: str
-    position: List[float]  # [x, y, z]
-    size: List[float]      # [width, depth, height]
+    position: Tuple[float, ...]  # (x, y, z)
+    size: Tuple[float, ...]      # (width, depth, height)
     material: str = "concrete"
 
+# 建物（コンクリート）による遮蔽時の追加損失 [dB]
+OCCLUSION_LOSS_DB = 15.0
+
+@njit(cache=True)
+def _segment_occluded(x1, y1, x2, y2, left, right, top, bottom):
+    """線分 (x1, y1)-(x2, y2) が矩形 [left, right] x [top, bottom] と交差するかを判定（Liang-Barsky, JITカーネル）"""
+    dx = x2 - x1
+    dy = y2 - y1
+    
+    if dx == 0 and dy == 0:
+        return False  # 同じ点
+    
+    t_min = 0.0
+    t_max = 1.0
+    
+    # X方向の境界チェック
+    if dx != 0:
+        t1 = (left - x1) / dx
+        t2 = (right - x1) / dx
+        if dx < 0:
+            t1, t2 = t2, t1
+        t_min = max(t_min, t1)
+        t_max = min(t_max, t2)
+    elif x1 < left or x1 > right:
+        return False
+    
+    # Y方向の境界チェック
+    if dy != 0:
+        t1 = (top - y1) / dy
+        t2 = (bottom - y1) / dy
+        if dy < 0:
+            t1, t2 = t2, t1
+        t_min = max(t_min, t1)
+        t_max = min(t_max, t2)
+    elif y1 < top or y1 > bottom:
+        return False
+    
+    # 交差判定
+    return t_min <= t_max and t_min >= 0 and t_max <= 1
+
+@njit(cache=True)
+def _occlusion_mask(bs_xy, vehicle_xy, left, right, top, bottom):
+    """全ての基地局-車両ペアについて遮蔽判定を行う
+    
+    bs_xy: (基地局数, 2), vehicle_xy: (車両数, 2)
+    戻り値: (基地局数, 車両数) のbool配列
+    """
+    mask = np.zeros((bs_xy.shape[0], vehicle_xy.shape[0]), dtype=np.bool_)
+    for i in range(bs_xy.shape[0]):
+        for j in range(vehicle_xy.shape[0]):
+            mask[i, j] = _segment_occluded(
+                vehicle_xy[j, 0], vehicle_xy[j, 1], bs_xy[i, 0], bs_xy[i, 1],
+                left, right, top, bottom
+            )
+    return mask
+
+def _occlusion_batch(p1_xy: np.ndarray, p2_xy: np.ndarray, left: float, right: float, top: float, bottom: float) -> np.ndarray:
+    """N本の線分 p1-p2 と矩形の交差判定を分岐なしのベクトル演算で一括に行う（_segment_occludedと同じ判定）
+    
+    p1_xy, p2_xy: (N, 2)
+    戻り値: (N,) のbool配列
+    """
+    lower = np.array([left, top])
+    upper = np.array([right, bottom])
+    delta = p2_xy - p1_xy
+    moving = delta != 0
+    
+    # 軸ごとのパラメータ範囲（dx < 0 の入れ替えは最小・最大で代用）
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lower - p1_xy) / delta
+        t2 = (upper - p1_xy) / delta
+    t_enter = np.where(moving, np.minimum(t1, t2), -np.inf)
+    t_exit = np.where(moving, np.maximum(t1, t2), np.inf)
+    
+    # 軸に平行な線分は、その軸で矩形の範囲外にあれば交差しない
+    within_slab = moving | ((p1_xy >= lower) & (p1_xy <= upper))
+    
+    t_min = np.maximum(t_enter.max(axis=1), 0.0)
+    t_max = np.minimum(t_exit.min(axis=1), 1.0)
+    return moving.any(axis=1) & within_slab.all(axis=1) & (t_min <= t_max)
+
+@tf.function(jit_compile=True, reduce_retracing=True)
+def _path_gain_from_cir(a):
+    """CIR係数から時間方向に電力を合計したパスゲインを計算
+    
+    XLAでabs→square→reduce_sumを1つのカーネルに融合し、パス数が変わっても再トレースを抑える
+    """
+    return tf.reduce_sum(tf.square(tf.abs(a)), axis=[-1])
+
+@lru_cache(maxsize=None)
+def _sionna_rt_resources():
+    """GPUの確認とアンテナ配列・PathSolverの生成を行う（プロセス内で一度だけ実行し、全インスタンスで共有）
+    
+    戻り値: (送信アンテナ配列, 受信アンテナ配列, PathSolver)
+    """
+    # Check GPU availability
+    gpus = tf.config.list_physical_devices('GPU')
+    if not gpus:
+        raise RuntimeError("No GPU found. SIONNA RT requires a GPU.")
+    
+    # Configure antenna arrays
+    tx_array = sn.rt.PlanarArray(
+        num_rows=1, num_cols=1, 
+        vertical_spacing=0.5, horizontal_spacing=0.5,
+        pattern="dipole", polarization="V"
+    )
+    rx_array = sn.rt.PlanarArray(
+        num_rows=1, num_cols=1,
+        vertical_spacing=0.5, horizontal_spacing=0.5, 
+        pattern="dipole", polarization="V"
+    )
+    
+    # PathSolverは全ステップで使い回す（毎回生成するとJITコンパイル済みのカーネルが再利用されない）
+    path_solver = sn.rt.PathSolver()
+    return tx_array, rx_array, path_solver
+
+class SimulationDataWriter:
+    """シミュレーション結果をステップごとにファイルへ書き出す
+    
+    出力は save_results と同じスキーマのJSON（simulation_data の各ステップを1行に1つ書き込む）
+    """
+    
+    def __init__(self, output_path: str, header: Dict[str, Any]):
+        self.output_path = output_path
+        # ステップごとの小さな書き込みをまとめるため、大きめのバッファで開く
+        self._file = open(output_path, 'w', buffering=1 << 20)
+        # ヘッダーの閉じ括弧を外し、simulation_data配列を開く
+        # （標準のJSONパーサーで読めるよう、Infinity/NaNは書き出さずエラーにする）
+        self._file.write(json.dumps(header, allow_nan=False)[:-1] + ', "simulation_data": [\n')
+        self._num_steps = 0
+    
+    def write(self, step_data: Dict[str, Any]) -> None:
+        """1ステップ分のデータを書き込む"""
+        if self._num_steps:
+            self._file.write(",\n")
+        self._file.write(json.dumps(step_data, separators=(',', ':'), allow_nan=False))
+        self._num_steps += 1
+    
+    def close(self) -> None:
+        """配列とオブジェクトを閉じてファイルを閉じる"""
+        self._file.write("\n]}\n")
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
 class V2XSimulation:
     """V2Xシミュレーション"""
     
@@ -44,28 +223,21 @@ class V2XSimulation:
         self.time_steps = 20
         self.time_step_duration = 1.0  # seconds
         self.world_size = [300, 300]
+        self.debug = False  # Trueの場合はペアごとの詳細ログを出力
+        self.verbose = False  # Trueの場合は時刻ごとの進捗・フォールバック要約を出力
+        # Trueの場合は全時刻の車両位置に受信機を置き、レイトレーシングを1回にまとめる
+        # （Falseなら時刻ごとに受信機を移動して解く。実機のSIONNAで結果を確認するまでは既定でFalse）
+        self.batch_time_steps = False
+        # get_vehicle_trajectoriesの結果と、それを計算したときの車両・時刻設定
+        self._trajectories: Optional[np.ndarray] = None
+        self._trajectories_key: Optional[tuple] = None
         
         # Initialize SIONNA RT
         self._init_sionna_rt()
     
     def _init_sionna_rt(self):
         """SIONNA RTの初期化"""
-        # Check GPU availability
-        gpus = tf.config.list_physical_devices('GPU')
-        if not gpus:
-            raise RuntimeError("No GPU found. SIONNA RT requires a GPU.")
-        
-        # Configure antenna arrays
-        self.tx_array = sn.rt.PlanarArray(
-            num_rows=1, num_cols=1, 
-            vertical_spacing=0.5, horizontal_spacing=0.5,
-            pattern="dipole", polarization="V"
-        )
-        self.rx_array = sn.rt.PlanarArray(
-            num_rows=1, num_cols=1,
-            vertical_spacing=0.5, horizontal_spacing=0.5, 
-            pattern="dipole", polarization="V"
-        )
+        self.tx_array, self.rx_array, self.path_solver = _sionna_rt_resources()
     
     def setup_scenario(self) -> None:
         """新しいシナリオをセットアップ"""
@@ -84,23 +256,23 @@ class V2XSimulation:
         for v_config in vehicles_config:
             vehicle = Vehicle(
                 id=v_config["id"],
-                initial_position=v_config["pos"] + [1.5],  # Add z coordinate
-                velocity=v_config["vel"]
+                initial_position=(*v_config["pos"], 1.5),  # Add z coordinate
+                velocity=tuple(v_config["vel"])
             )
             self.vehicles.append(vehicle)
         
         # 2つの基地局
         self.base_stations = [
-            BaseStation(id="bs_1", position=[80, 80, 15]),
-            BaseStation(id="bs_2", position=[220, 180, 15])
+            BaseStation(id="bs_1", position=(80, 80, 15)),
+            BaseStation(id="bs_2", position=(220, 180, 15))
         ]
         
         # 1つの建物（車両軌道間に配置して遮蔽効果を作る）
         self.buildings = [
             Building(
                 id="building_1",
-                position=[150, 120, 0],  # 基地局bs_1とvehicle軌道の間
-                size=[50, 30, 25],       # 幅x奥行きx高さ（少し小さく）
+                position=(150, 120, 0),  # 基地局bs_1とvehicle軌道の間
+                size=(50, 30, 25),       # 幅x奥行きx高さ（少し小さく）
                 material="concrete"
             )
         ]
@@ -145,74 +317,89 @@ class V2XSimulation:
         
         return scene
     
-    def _check_building_occlusion(self, point1: List[float], point2: List[float]) -> bool:
-        """2点間の直線が建物と交差するかをチェック"""
-        if not self.buildings:
-            return False
-        
-        building = self.buildings[0]  # 現在は1つの建物のみサポート
-        
-        x1, y1 = point1[:2]
-        x2, y2 = point2[:2]
+    def _building_bounds(self, building: Building) -> Tuple[float, float, float, float]:
+        """建物の境界 (left, right, top, bottom) を返す"""
         cx, cy = building.position[:2]
         w, h = building.size[:2]
+        return float(cx - w/2), float(cx + w/2), float(cy - h/2), float(cy + h/2)
+    
+    def _building_occlusion_mask(self, vehicle_positions: np.ndarray) -> np.ndarray:
+        """全基地局-車両ペアの遮蔽判定をまとめて行う
         
-        # 建物の境界
-        left = cx - w/2
-        right = cx + w/2
-        top = cy - h/2
-        bottom = cy + h/2
-        
-        # 線分が矩形と交差するかをチェック（Liang-Barsky algorithm）
-        dx = x2 - x1
-        dy = y2 - y1
-        
-        if dx == 0 and dy == 0:
-            return False  # 同じ点
-        
-        t_min = 0.0
-        t_max = 1.0
-        
-        # X方向の境界チェック
-        if dx != 0:
-            t1 = (left - x1) / dx
-            t2 = (right - x1) / dx
-            if dx < 0:
-                t1, t2 = t2, t1
-            t_min = max(t_min, t1)
-            t_max = min(t_max, t2)
-        elif x1 < left or x1 > right:
-            return False
-        
-        # Y方向の境界チェック
-        if dy != 0:
-            t1 = (top - y1) / dy
-            t2 = (bottom - y1) / dy
-            if dy < 0:
-                t1, t2 = t2, t1
-            t_min = max(t_min, t1)
-            t_max = min(t_max, t2)
-        elif y1 < top or y1 > bottom:
-            return False
-        
-        # 交差判定
-        return t_min <= t_max and t_min >= 0 and t_max <= 1
+        vehicle_positions: 1時刻分 (車両数, 3) または全軌跡 (time_steps, 車両数, 3)
+        戻り値: (基地局数, 車両数) または (time_steps, 基地局数, 車両数) のbool配列
+        """
+        leading_shape = vehicle_positions.shape[:-2]
+        num_bs, num_vehicles = len(self.base_stations), vehicle_positions.shape[-2]
+        if not self.buildings:
+            return np.zeros(leading_shape + (num_bs, num_vehicles), dtype=bool)
+        
+        # 時刻方向は車両方向に平坦化し、全時刻の線分を1回で判定する
+        bs_xy = np.array([bs.position[:2] for bs in self.base_stations], dtype=np.float64)
+        vehicle_xy = np.ascontiguousarray(vehicle_positions[..., :2], dtype=np.float64).reshape(-1, 2)
+        bounds = self._building_bounds(self.buildings[0])
+        if NUMBA_AVAILABLE:
+            mask = _occlusion_mask(bs_xy, vehicle_xy, *bounds)
+        else:
+            # numbaが無い場合は全ペアの線分を並べてNumPyで一括判定する（車両→基地局の向き）
+            num_segments = (num_bs, len(vehicle_xy), 2)
+            p1 = np.broadcast_to(vehicle_xy[None, :, :], num_segments).reshape(-1, 2)
+            p2 = np.broadcast_to(bs_xy[:, None, :], num_segments).reshape(-1, 2)
+            mask = _occlusion_batch(p1, p2, *bounds).reshape(num_bs, len(vehicle_xy))
+        
+        # (基地局数, 時刻*車両数) -> (時刻..., 基地局数, 車両数)
+        mask = mask.reshape((num_bs,) + leading_shape + (num_vehicles,))
+        return np.moveaxis(mask, 0, -2)
+    
+    def _build_pair_ids(self) -> None:
+        """パスロスペアの (source, target) ID組を一度だけ作っておく（行列の行優先順）"""
+        self._v2i_pair_ids = [(vehicle.id, bs.id) for bs in self.base_stations for vehicle in self.vehicles]
+        self._v2v_pair_ids = [
+            (vehicle_i.id, vehicle_j.id)
+            for i, vehicle_i in enumerate(self.vehicles)
+            for j, vehicle_j in enumerate(self.vehicles)
+            if i != j
+        ]
+        # V2V行列を平坦化したときに対角成分（同一車両）を除くためのマスク
+        num_vehicles = len(self.vehicles)
+        self._v2v_off_diagonal = [i != j for i in range(num_vehicles) for j in range(num_vehicles)]
     
     def get_vehicle_position(self, vehicle: Vehicle, time_step: int) -> List[float]:
-        """指定された時刻での車両位置を計算"""
-        time = time_step * self.time_step_duration
-        x = vehicle.initial_position[0] + vehicle.velocity[0] * time
-        y = vehicle.initial_position[1] + vehicle.velocity[1] * time
-        z = vehicle.initial_position[2]
+        """指定された時刻での車両位置を返す（事前計算した軌跡 (T, V, 3) から引く）"""
+        return self._cached_trajectories()[time_step, self.vehicles.index(vehicle)].tolist()
+    
+    def _cached_trajectories(self) -> np.ndarray:
+        """get_vehicle_trajectoriesの結果を、車両・時刻設定が変わるまで使い回す"""
+        key = (tuple(self.vehicles), self.time_steps, self.time_step_duration, tuple(self.world_size))
+        if self._trajectories_key != key:
+            self._trajectories = self.get_vehicle_trajectories()
+            self._trajectories_key = key
+        return self._trajectories
+    
+    def get_vehicle_trajectories(self) -> np.ndarray:
+        """全時刻・全車両の位置をまとめて計算（速度に時刻を掛けて初期位置に足し、ワールド境界内に収める）
+        
+        戻り値: (time_steps, 車両数, 3) の配列
+        """
+        initial_positions = np.array([v.initial_position for v in self.vehicles], dtype=np.float64).reshape(-1, 3)
+        velocities = np.zeros_like(initial_positions)
+        velocities[:, :2] = [v.velocity[:2] for v in self.vehicles]
+        
+        times = np.arange(self.time_steps)[:, None, None] * self.time_step_duration
+        positions = initial_positions[None] + velocities[None] * times
         
         # Keep vehicles within world bounds
-        x = max(10, min(self.world_size[0] - 10, x))
-        y = max(10, min(self.world_size[1] - 10, y))
+        np.clip(positions[..., 0], 10, self.world_size[0] - 10, out=positions[..., 0])
+        np.clip(positions[..., 1], 10, self.world_size[1] - 10, out=positions[..., 1])
         
-        return [x, y, z]
+        return positions
     
-    def run_simulation(self) -> Dict[str, Any]:
-        """シミュレーション実行"""
+    def run_simulation(self, output_path: Optional[str] = None) -> Dict[str, Any]:
+        """シミュレーション実行
+        
+        output_pathを指定すると各ステップの結果をその場でファイルに書き出し、
+        メモリ上には保持しない（results["simulation_data"] は含まれない）
+        """
         print("Starting smart V2X simulation...")
         
         results = {
@@ -221,179 +408,255 @@ class V2XSimulation:
             "vehicles": len(self.vehicles),
             "base_stations": len(self.base_stations),
             "buildings": len(self.buildings),
-            "simulation_data": []
         }
+        if output_path is None:
+            results["simulation_data"] = []
+            writer = None
+        else:
+            writer = SimulationDataWriter(output_path, results)
+            results["output_path"] = output_path
         
-        for step in range(self.time_steps):
-            print(f"Processing time step {step+1}/{self.time_steps}")
-            
-            # Create SIONNA scene for this time step
-            scene = self._create_sionna_scene()
-            
-            # Add transmitters (base stations)
-            for bs in self.base_stations:
-                scene.add(sn.rt.Transmitter(name=f"tx_{bs.id}", position=bs.position))
-            
-            # Add receivers (vehicles at current positions)
+        # 分析用にペアごとの統計をシミュレーション中に逐次集計しておく
+        path_loss_stats = {}
+        
+        # 全時刻の車両位置を一括計算: (T, V, 3)
+        trajectories = self._cached_trajectories()
+        self._build_pair_ids()
+        
+        # 建物は静止しているので、全時刻の遮蔽判定も軌跡からまとめて求めておく: (T, 基地局数, 車両数)
+        occlusion_masks = self._building_occlusion_mask(trajectories)
+        
+        # 建物・基地局・アンテナは時刻によらないため、シーンは一度だけ構築する
+        scene = self._create_sionna_scene()
+        
+        # Add transmitters (base stations)
+        for bs in self.base_stations:
+            scene.add(sn.rt.Transmitter(name=f"tx_{bs.id}", position=bs.position))
+        
+        if self.batch_time_steps:
+            # Add receivers (vehicles) at every time step: rx index = step * 車両数 + vehicle index
+            for step, positions in enumerate(trajectories.tolist()):
+                for vehicle, position in zip(self.vehicles, positions):
+                    scene.add(sn.rt.Receiver(name=f"rx_{vehicle.id}_t{step}", position=position))
+        else:
+            # Add receivers (vehicles), positions are updated in place every step
+            receivers = []
             for vehicle in self.vehicles:
-                pos = self.get_vehicle_position(vehicle, step)
-                scene.add(sn.rt.Receiver(name=f"rx_{vehicle.id}", position=pos))
-            
-            # Compute path loss for V2I and V2V
-            v2i_matrix, v2v_matrix, path_loss_pairs = self._compute_path_loss_with_v2v(scene, step)
-            
-            # Store step data
-            step_data = {
-                "time_step": step,
-                "time": step * self.time_step_duration,
-                "vehicle_positions": {
-                    vehicle.id: self.get_vehicle_position(vehicle, step)
-                    for vehicle in self.vehicles
-                },
-                "v2i_path_loss_matrix": v2i_matrix.tolist(),
-                "v2v_path_loss_matrix": v2v_matrix.tolist(),
-                "path_loss_pairs": path_loss_pairs
-            }
+                receiver = sn.rt.Receiver(name=f"rx_{vehicle.id}", position=vehicle.initial_position)
+                scene.add(receiver)
+                receivers.append(receiver)
+        
+        # レイトレーシングは1本のワーカースレッドで順番に実行し、次ステップの計算中に
+        # 現ステップのNumPy処理・ペア整形・書き出しをメインスレッドで行う（シーンに触るのはワーカーのみ）
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            traced = None
+            if self.batch_time_steps:
+                # 1回だけ解き、各時刻の受信機分を切り出すタスクを順に積んでおく
+                batch_traced = executor.submit(self._trace_paths, scene)
+                step_traced = [
+                    executor.submit(self._time_step_cir, batch_traced, step, len(self.vehicles))
+                    for step in range(self.time_steps)
+                ]
+            elif self.time_steps > 0:
+                traced = executor.submit(self._trace_paths, scene, receivers, trajectories[0])
             
-            results["simulation_data"].append(step_data)
+            for step in range(self.time_steps):
+                if self.verbose:
+                    print(f"Processing time step {step+1}/{self.time_steps}")
+                
+                if self.batch_time_steps:
+                    current_traced = step_traced[step]
+                else:
+                    current_traced = traced
+                    if step + 1 < self.time_steps:
+                        traced = executor.submit(self._trace_paths, scene, receivers, trajectories[step + 1])
+                
+                # Compute path loss for V2I and V2V
+                v2i_matrix, v2v_matrix, path_loss_pairs = self._compute_path_loss_with_v2v(
+                    scene, step, trajectories[step], traced=current_traced, occlusion_mask=occlusion_masks[step]
+                )
+                
+                # Store step data
+                step_data = {
+                    "time_step": step,
+                    "time": step * self.time_step_duration,
+                    "vehicle_positions": {
+                        vehicle.id: position
+                        for vehicle, position in zip(self.vehicles, trajectories[step].tolist())
+                    },
+                    "v2i_path_loss_matrix": v2i_matrix,
+                    "v2v_path_loss_matrix": v2v_matrix,
+                    "path_loss_pairs": path_loss_pairs
+                }
+                
+                _update_path_loss_stats(path_loss_stats, path_loss_pairs)
+                
+                if writer is None:
+                    results["simulation_data"].append(step_data)
+                else:
+                    writer.write(step_data)
+        finally:
+            executor.shutdown(wait=True)
+            if writer is not None:
+                writer.close()
+                print(f"✅ Results saved to {output_path}")
+        
+        results["path_loss_stats"] = path_loss_stats
         
         print("✅ Smart V2X simulation completed")
         return results
     
-    def _compute_path_loss_with_v2v(self, scene: sn.rt.Scene, current_step: int) -> tuple[np.ndarray, np.ndarray, list]:
-        """V2IとV2Vの両方のパスロス計算"""
+    def _distance_based_v2i_path_loss(self, vehicle_positions: np.ndarray, occlusion_mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """距離ベースのV2Iパスロス（建物遮蔽の追加損失込み、上限なし）を全ペア分まとめて計算
+        
+        戻り値: 距離 (基地局数, 車両数), パスロス [dB] (基地局数, 車両数)
+        """
+        bs_xy = np.array([bs.position[:2] for bs in self.base_stations], dtype=np.float64)
+        offsets = bs_xy[:, None, :] - vehicle_positions[None, :, :2]
+        distances = np.hypot(offsets[..., 0], offsets[..., 1])
+        
+        # Calculate basic path loss (40dB within 1m)
+        with np.errstate(divide='ignore'):
+            path_loss_db = np.where(
+                distances > 1,
+                40.0 + 20 * np.log10(distances) + 20 * np.log10(5.9/2.4),
+                40.0
+            )
+        
+        # Additional loss due to concrete building
+        path_loss_db += OCCLUSION_LOSS_DB * occlusion_mask
+        return distances, path_loss_db
+    
+    def _trace_paths(self, scene: sn.rt.Scene, receivers: Optional[list] = None, vehicle_positions: Optional[np.ndarray] = None):
+        """（受信機を指定時刻の位置へ移動して）レイトレーシングを行い、CIR係数を返す"""
+        if receivers is not None:
+            # Move receivers (vehicles) to their current positions
+            for receiver, position in zip(receivers, vehicle_positions):
+                receiver.position = position.tolist()
+        
+        # Compute paths
+        paths = self.path_solver(scene=scene, max_depth=5)
+        
+        # Extract path loss
+        a, _ = paths.cir()
+        
+        # Convert to TensorFlow tensors if needed（使うのは先頭要素だけなので、残りは変換しない）
+        if isinstance(a, list):
+            a = [tf.convert_to_tensor(x) for x in a[:1]]
+        return a
+    
+    def _time_step_cir(self, batch_traced: Future, step: int, num_vehicles: int) -> list:
+        """全時刻まとめて解いたCIR係数から、指定時刻の受信機分だけを切り出す
+        
+        a[0]の形は (num_rx, num_rx_ant, num_tx, num_tx_ant, num_paths, num_time_steps) なので、
+        受信機（step * 車両数 + vehicle index）の軸0で切り出す
+        """
+        a = batch_traced.result()
+        if len(a[0].shape) < 6:
+            return a  # 想定外の形はそのまま返し、後段の形状チェックでフォールバックさせる
+        return [a[0][step * num_vehicles:(step + 1) * num_vehicles]]
+    
+    def _compute_path_loss_with_v2v(self, scene: sn.rt.Scene, current_step: int, vehicle_positions: np.ndarray, traced: Optional[Future] = None, occlusion_mask: Optional[np.ndarray] = None) -> tuple[list, list, list]:
+        """V2IとV2Vの両方のパスロス計算（vehicle_positions: 現在時刻の車両位置 (車両数, 3)）
+        
+        tracedにはワーカーで実行中の _trace_paths のFutureを渡せる（省略時はその場でレイトレーシング）
+        occlusion_maskには事前計算した現在時刻の遮蔽判定 (基地局数, 車両数) を渡せる（省略時はその場で判定）
+        行列はJSONにそのまま書ける入れ子リストで返す（ndarrayからの変換は各行列1回だけ）
+        """
         try:
-            # Compute paths
-            path_solver = sn.rt.PathSolver()
-            paths = path_solver(scene=scene, max_depth=5)
-            
-            # Extract path loss
-            a, _ = paths.cir()
-            
-            # Convert to TensorFlow tensors if needed
-            if isinstance(a, list):
-                a = [tf.convert_to_tensor(x) for x in a]
+            a = traced.result() if traced is not None else self._trace_paths(scene)
             
             # V2I path loss matrix (base stations to vehicles)
             num_bs = len(self.base_stations)
             num_vehicles = len(self.vehicles)
-            v2i_matrix = np.zeros((num_bs, num_vehicles))
             
-            # V2V path loss matrix (vehicles to vehicles)  
-            v2v_matrix = np.zeros((num_vehicles, num_vehicles))
+            # 全基地局-車両ペアの建物遮蔽を一度に判定し、距離ベースのフォールバック値もまとめて計算
+            if occlusion_mask is None:
+                occlusion_mask = self._building_occlusion_mask(vehicle_positions)
+            fallback_distances, fallback_db = self._distance_based_v2i_path_loss(vehicle_positions, occlusion_mask)
             
-            path_loss_pairs = []
+            # フォールバック値で初期化し、SIONNAのパスゲインが得られたペアだけ上書きする
+            v2i_matrix = np.minimum(fallback_db, 120.0)
+            used_fallback = np.ones((num_bs, num_vehicles), dtype=bool)
             
-            # Calculate V2I path loss
-            for i in range(num_bs):
-                for j in range(num_vehicles):
-                    try:
-                        # Check tensor dimensions before accessing
-                        tensor_shape = a[0].shape
-                        print(f"Debug: Tensor shape for step {current_step}: {tensor_shape}")
-                        
-                        if len(tensor_shape) >= 6 and i < tensor_shape[0] and j < tensor_shape[2]:
-                            path_gain = tf.reduce_sum(tf.square(tf.abs(a[0][i, 0, j, 0, :, :])), axis=[-1]).numpy()
-                            if isinstance(path_gain, np.ndarray) and len(path_gain) > 0:
-                                path_gain = path_gain[0]
-                            path_loss_db = -10 * np.log10(path_gain) if path_gain > 0 else 120.0
-                            v2i_matrix[i, j] = min(path_loss_db, 120.0)
-                        else:
-                            # Use distance-based fallback calculation with building occlusion
-                            bs_pos = self.base_stations[i].position
-                            vehicle_pos = self.get_vehicle_position(self.vehicles[j], current_step)
-                            distance = np.sqrt(
-                                (bs_pos[0] - vehicle_pos[0])**2 + 
-                                (bs_pos[1] - vehicle_pos[1])**2
-                            )
-                            
-                            # Calculate basic path loss
-                            if distance > 1:
-                                path_loss_db = 40.0 + 20 * np.log10(distance) + 20 * np.log10(5.9/2.4)
-                            else:
-                                path_loss_db = 40.0
-                            
-                            # Check for building occlusion and add additional loss
-                            is_occluded = self._check_building_occlusion(vehicle_pos, bs_pos)
-                            if is_occluded:
-                                occlusion_loss = 15.0  # Additional loss due to concrete building
-                                path_loss_db += occlusion_loss
-                                print(f"Building occlusion detected for {self.vehicles[j].id}-{self.base_stations[i].id}: +{occlusion_loss}dB")
-                            
-                            v2i_matrix[i, j] = min(path_loss_db, 120.0)
-                            occlusion_status = " (occluded)" if is_occluded else " (clear)"
-                            print(f"Using distance-based calculation for {self.vehicles[j].id}-{self.base_stations[i].id}: {distance:.1f}m -> {path_loss_db:.1f}dB{occlusion_status}")
-                        
-                        path_loss_pairs.append({
-                            "source": self.vehicles[j].id,
-                            "target": self.base_stations[i].id,
-                            "path_loss_db": float(v2i_matrix[i, j]),
-                            "link_type": "V2I"
-                        })
-                    except Exception as e:
-                        print(f"Exception in V2I calculation for {self.vehicles[j].id}-{self.base_stations[i].id}: {e}")
-                        # Use distance-based fallback with building occlusion
-                        bs_pos = self.base_stations[i].position
-                        vehicle_pos = self.get_vehicle_position(self.vehicles[j], current_step)
-                        distance = np.sqrt(
-                            (bs_pos[0] - vehicle_pos[0])**2 + 
-                            (bs_pos[1] - vehicle_pos[1])**2
-                        )
-                        
-                        # Calculate basic path loss
-                        if distance > 1:
-                            path_loss_db = 40.0 + 20 * np.log10(distance) + 20 * np.log10(5.9/2.4)
-                        else:
-                            path_loss_db = 40.0
-                        
-                        # Check for building occlusion and add additional loss
-                        is_occluded = self._check_building_occlusion(vehicle_pos, bs_pos)
-                        if is_occluded:
-                            occlusion_loss = 15.0  # Additional loss due to concrete building
-                            path_loss_db += occlusion_loss
-                        
-                        v2i_matrix[i, j] = min(path_loss_db, 120.0)
-                        
-                        path_loss_pairs.append({
-                            "source": self.vehicles[j].id,
-                            "target": self.base_stations[i].id,
-                            "path_loss_db": float(v2i_matrix[i, j]),
-                            "link_type": "V2I"
-                        })
+            # Calculate V2I path loss (all pairs in a single reduction)
+            try:
+                # Check tensor dimensions before accessing
+                tensor_shape = a[0].shape
+                if self.debug:
+                    print(f"Debug: Tensor shape for step {current_step}: {tensor_shape}")
+                
+                if len(tensor_shape) >= 6 and tensor_shape[4] > 0:
+                    num_rt_bs = min(num_bs, tensor_shape[0])
+                    num_rt_vehicles = min(num_vehicles, tensor_shape[2])
+                    # 各ペアの先頭パスについて、時間方向にゲインを合計
+                    path_gain = _path_gain_from_cir(a[0][:num_rt_bs, 0, :num_rt_vehicles, 0, 0, :]).numpy()
+                    with np.errstate(divide='ignore'):
+                        path_loss_db = np.where(path_gain > 0, -10 * np.log10(path_gain), 120.0)
+                    v2i_matrix[:num_rt_bs, :num_rt_vehicles] = np.minimum(path_loss_db, 120.0)
+                    used_fallback[:num_rt_bs, :num_rt_vehicles] = False
+            except Exception as e:
+                print(f"Exception in V2I calculation for step {current_step}: {e}")
+            
+            if self.debug:
+                for i, j in zip(*np.nonzero(used_fallback)):
+                    if occlusion_mask[i, j]:
+                        print(f"Building occlusion detected for {self.vehicles[j].id}-{self.base_stations[i].id}: +{OCCLUSION_LOSS_DB}dB")
+                    occlusion_status = " (occluded)" if occlusion_mask[i, j] else " (clear)"
+                    print(f"Using distance-based calculation for {self.vehicles[j].id}-{self.base_stations[i].id}: {fallback_distances[i, j]:.1f}m -> {fallback_db[i, j]:.1f}dB{occlusion_status}")
+            
+            # ペアごとのログの代わりに、時刻ごとに1行だけ要約を出力
+            if self.verbose and used_fallback.any():
+                print(f"Using distance-based calculation for {int(used_fallback.sum())}/{used_fallback.size} V2I pairs ({int((used_fallback & occlusion_mask).sum())} occluded)")
+            
+            v2i_rows = v2i_matrix.tolist()
+            path_loss_pairs = [
+                {
+                    "source": source,
+                    "target": target,
+                    "path_loss_db": path_loss_db,
+                    "link_type": "V2I"
+                }
+                for (source, target), path_loss_db in zip(self._v2i_pair_ids, chain.from_iterable(v2i_rows))
+            ]
             
             # Calculate V2V path loss (simplified approach using distance)
-            for i in range(num_vehicles):
-                for j in range(num_vehicles):
-                    if i == j:
-                        v2v_matrix[i, j] = float('inf')  # Same vehicle
-                    else:
-                        # Get current positions for current step
-                        pos_i = self.get_vehicle_position(self.vehicles[i], current_step)
-                        pos_j = self.get_vehicle_position(self.vehicles[j], current_step)
-                        
-                        # Calculate distance
-                        distance = np.sqrt(
-                            (pos_i[0] - pos_j[0])**2 + 
-                            (pos_i[1] - pos_j[1])**2
-                        )
-                        
-                        # Simplified V2V path loss model for urban environment
-                        # Based on Winner+ model for V2V communication
-                        if distance > 1:
-                            path_loss_db = 38.77 + 16.7 * np.log10(distance) + 18.2 * np.log10(5.9)
-                        else:
-                            path_loss_db = 40.0  # Minimum path loss
-                        
-                        v2v_matrix[i, j] = min(path_loss_db, 120.0)
-                        
-                        path_loss_pairs.append({
-                            "source": self.vehicles[i].id,
-                            "target": self.vehicles[j].id,
-                            "path_loss_db": float(v2v_matrix[i, j]),
-                            "link_type": "V2V"
-                        })
+            # 距離は対称なので上三角のペアだけ計算し、下三角へ写す
+            upper_i, upper_j = np.triu_indices(num_vehicles, k=1)
+            offsets = vehicle_positions[upper_i, :2] - vehicle_positions[upper_j, :2]
+            # 距離の2乗を一括計算（log10(d) = 0.5 * log10(d^2) なのでsqrtは不要）
+            squared_distances = np.einsum('ij,ij->i', offsets, offsets)
+            
+            # Simplified V2V path loss model for urban environment
+            # Based on Winner+ model for V2V communication (minimum path loss 40dB within 1m)
+            with np.errstate(divide='ignore'):
+                pair_path_loss = np.where(
+                    squared_distances > 1,
+                    38.77 + 8.35 * np.log10(squared_distances) + 18.2 * np.log10(5.9),
+                    40.0
+                )
+            np.minimum(pair_path_loss, 120.0, out=pair_path_loss)
+            
+            v2v_matrix = np.full((num_vehicles, num_vehicles), float('inf'))  # Same vehicle on the diagonal
+            v2v_matrix[upper_i, upper_j] = pair_path_loss
+            v2v_matrix[upper_j, upper_i] = pair_path_loss
+            v2v_rows = v2v_matrix.tolist()
+            _clear_v2v_diagonal(v2v_rows)
+            
+            path_loss_pairs.extend(
+                {
+                    "source": source,
+                    "target": target,
+                    "path_loss_db": path_loss_db,
+                    "link_type": "V2V"
+                }
+                for (source, target), path_loss_db in zip(
+                    self._v2v_pair_ids, compress(chain.from_iterable(v2v_rows), self._v2v_off_diagonal)
+                )
+            )
             
-            return v2i_matrix, v2v_matrix, path_loss_pairs
+            return v2i_rows, v2v_rows, path_loss_pairs
             
         except Exception as e:
             print(f"Warning: Path loss calculation failed: {e}")
@@ -424,36 +687,41 @@ class V2XSimulation:
                             "link_type": "V2V"
                         })
             
-            return v2i_matrix, v2v_matrix, path_loss_pairs
+            v2v_rows = v2v_matrix.tolist()
+            _clear_v2v_diagonal(v2v_rows)
+            return v2i_matrix.tolist(), v2v_rows, path_loss_pairs
 
     def _compute_path_loss(self, scene: sn.rt.Scene) -> np.ndarray:
         """パスロス計算"""
         try:
             # Compute paths
-            path_solver = sn.rt.PathSolver()
-            paths = path_solver(scene=scene, max_depth=5)
+            paths = self.path_solver(scene=scene, max_depth=5)
             
             # Extract path loss
             a, _ = paths.cir()
             
-            # Convert to TensorFlow tensors if needed
+            # Convert to TensorFlow tensors if needed（使うのは先頭要素だけなので、残りは変換しない）
             if isinstance(a, list):
-                a = [tf.convert_to_tensor(x) for x in a]
+                a = [tf.convert_to_tensor(x) for x in a[:1]]
             
             # Calculate path loss matrix
             num_bs = len(self.base_stations)
             num_vehicles = len(self.vehicles)
-            path_loss_matrix = np.zeros((num_bs, num_vehicles))
+            path_loss_matrix = np.full((num_bs, num_vehicles), 120.0)  # Default high path loss
             
-            for i in range(num_bs):
-                for j in range(num_vehicles):
-                    # Extract path gain and convert to path loss
-                    try:
-                        path_gain = tf.reduce_sum(tf.square(tf.abs(a[0][i, 0, j, 0, :, :])), axis=[-1]).numpy()[0]
-                        path_loss_db = -10 * np.log10(path_gain) if path_gain > 0 else 150.0  # 150dB as max loss
-                        path_loss_matrix[i, j] = path_loss_db
-                    except:
-                        path_loss_matrix[i, j] = 120.0  # Default high path loss
+            # テンソルに含まれるペアだけ、先頭パスのゲインを1回のリダクションでまとめて求める
+            try:
+                tensor_shape = a[0].shape
+                if len(tensor_shape) >= 6 and tensor_shape[4] > 0:
+                    num_rt_bs = min(num_bs, tensor_shape[0])
+                    num_rt_vehicles = min(num_vehicles, tensor_shape[2])
+                    path_gain = _path_gain_from_cir(a[0][:num_rt_bs, 0, :num_rt_vehicles, 0, 0, :]).numpy()
+                    with np.errstate(divide='ignore'):
+                        # 150dB as max loss
+                        path_loss_matrix[:num_rt_bs, :num_rt_vehicles] = np.where(path_gain > 0, -10 * np.log10(path_gain), 150.0)
+            except Exception as e:
+                # 想定外のテンソルは既定の高パスロスのままにし、GPUエラー等を握りつぶさないよう内容は表示する
+                print(f"❌ Path gain extraction failed, using default path loss: {e}")
             
             return path_loss_matrix
             
@@ -469,6 +737,12 @@ class V2XSimulation:
             json.dump(results, f, indent=2)
         print(f"✅ Results saved to {output_path}")
     
+    def _iter_simulation_data(self, results: Dict[str, Any]):
+        """各ステップのデータを返す（ファイルに書き出した場合はファイルからステップ単位で読み込む）"""
+        if "simulation_data" in results:
+            return results["simulation_data"]
+        return iter_simulation_steps(results["output_path"])
+    
     def analyze_occlusion_effects(self, results: Dict[str, Any]) -> Dict[str, Any]:
         """遮蔽効果の分析"""
         analysis = {
@@ -478,23 +752,25 @@ class V2XSimulation:
             "path_loss_statistics": {}
         }
         
+        # シミュレーション中に集計した統計を使う（無ければステップデータを1回だけ走査して集計）
+        path_loss_stats = results.get("path_loss_stats")
+        if path_loss_stats is None:
+            path_loss_stats = {}
+            for step_data in self._iter_simulation_data(results):
+                _update_path_loss_stats(path_loss_stats, step_data["path_loss_pairs"])
+        
         # Analyze path loss variations for each vehicle-BS pair
         for bs in self.base_stations:
             for vehicle in self.vehicles:
                 pair_key = f"{vehicle.id}-{bs.id}"
-                path_losses = []
-                
-                for step_data in results["simulation_data"]:
-                    for pair in step_data["path_loss_pairs"]:
-                        if pair["source"] == vehicle.id and pair["target"] == bs.id:
-                            path_losses.append(pair["path_loss_db"])
+                pair_stats = path_loss_stats.get(pair_key)
                 
-                if path_losses:
+                if pair_stats is not None:
                     analysis["path_loss_statistics"][pair_key] = {
-                        "min": min(path_losses),
-                        "max": max(path_losses),
-                        "mean": sum(path_losses) / len(path_losses),
-                        "variation": max(path_losses) - min(path_losses)
+                        "min": pair_stats["min"],
+                        "max": pair_stats["max"],
+                        "mean": pair_stats["sum"] / pair_stats["count"],
+                        "variation": pair_stats["max"] - pair_stats["min"]
                     }
         
         return analysis
@@ -505,14 +781,13 @@ def main():
     sim = V2XSimulation()
     sim.setup_scenario()
     
-    # Run simulation
-    results = sim.run_simulation()
+    # Run simulation (step data is streamed to disk as it is computed)
+    results = sim.run_simulation(output_path="output/simulation_results.json")
     
     # Analyze results
     analysis = sim.analyze_occlusion_effects(results)
     
     # Save results
-    sim.save_results(results, "simulation_results.json")
     sim.save_results(analysis, "analysis.json")
     
     # Print summary
@@ -528,6 +803,11 @@ def main():
         print("\n=== Path Loss Analysis ===")
         for pair, stats in analysis["path_loss_statistics"].items():
             print(f"{pair}: {stats['min']:.1f} - {stats['max']:.1f} dB (variation: {stats['variation']:.1f} dB)")
+    
+    # Convert the results for the browser visualization in the same process
+    visualizer = V2XVisualizer()
+    if visualizer.convert_simulation_data_to_visualization(results, "visualization/data.json"):
+        visualizer.create_html_visualization()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
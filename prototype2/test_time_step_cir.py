@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test slicing of the batched CIR into per-time-step CIRs
+"""
+from concurrent.futures import Future
+import numpy as np
+from simulation import V2XSimulation
+
+NUM_TIME_STEPS = 3
+NUM_VEHICLES = 4
+NUM_BASE_STATIONS = 2
+NUM_PATHS = 2
+
+
+def _step_cir(step):
+    """1時刻分のCIR（受信機=車両）をドキュメントどおりの形で作る
+    
+    形: (num_rx, num_rx_ant, num_tx, num_tx_ant, num_paths, num_time_steps)
+    値は (時刻, 車両, 基地局, パス) ごとに異なるようにしておく
+    """
+    a = np.zeros((NUM_VEHICLES, 1, NUM_BASE_STATIONS, 1, NUM_PATHS, 1), dtype=np.complex64)
+    for v in range(NUM_VEHICLES):
+        for b in range(NUM_BASE_STATIONS):
+            for p in range(NUM_PATHS):
+                a[v, 0, b, 0, p, 0] = 1000 * step + 100 * v + 10 * b + p + 1
+    return a
+
+
+def _time_step_cir(a, step):
+    """V2XSimulation._time_step_cir を（SIONNAの初期化なしで）呼び出す"""
+    sim = V2XSimulation.__new__(V2XSimulation)
+    batch_traced = Future()
+    batch_traced.set_result(a)
+    return sim._time_step_cir(batch_traced, step, NUM_VEHICLES)
+
+
+def test_batched_cir_matches_per_step_cir():
+    """全時刻まとめたCIR（受信機 = step * 車両数 + vehicle）から、各時刻のCIRがそのまま取り出せること"""
+    batched = np.concatenate([_step_cir(step) for step in range(NUM_TIME_STEPS)], axis=0)
+    
+    for step in range(NUM_TIME_STEPS):
+        sliced = _time_step_cir([batched], step)
+        assert len(sliced) == 1
+        assert sliced[0].shape == (NUM_VEHICLES, 1, NUM_BASE_STATIONS, 1, NUM_PATHS, 1)
+        np.testing.assert_array_equal(sliced[0], _step_cir(step))
+
+
+def test_unexpected_shape_is_passed_through():
+    """想定外の形のCIRは切り出さずにそのまま返すこと（後段の形状チェックでフォールバックさせる）"""
+    a = [np.zeros((NUM_BASE_STATIONS, NUM_TIME_STEPS * NUM_VEHICLES))]
+    assert _time_step_cir(a, 1) is a
+
+
+if __name__ == "__main__":
+    test_batched_cir_matches_per_step_cir()
+    test_unexpected_shape_is_passed_through()
+    print("✅ All CIR slicing tests passed")
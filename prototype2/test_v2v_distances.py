@@ -3,6 +3,10 @@
 Test V2V distances and path loss calculations
 """
 import numpy as np
+from numba_compat import njit, prange, NUMBA_AVAILABLE
+
+# V2Vパスロス式の距離に依存しない項（定数なので一度だけ計算）
+V2V_PATH_LOSS_OFFSET = 38.77 + 18.2 * np.log10(5.9)
 
 # Vehicle initial positions 
 vehicles_pos = [
@@ -12,50 +16,67 @@ vehicles_pos = [
     [190, 200]  # vehicle_4
 ]
 
+# Vehicle velocities [m/s]（vehicles_posと同じ順）
+vehicles_vel = [
+    [6, 0],   # vehicle_1
+    [-4, 0],  # vehicle_2
+    [0, 5],   # vehicle_3
+    [0, -4]   # vehicle_4
+]
+
+@njit(parallel=True, cache=True)
+def _v2v_path_loss_kernel(xy):
+    """全車両ペアの距離とV2Vパスロスを車両方向に並列計算（JITカーネル、一時配列なし）"""
+    num_vehicles = xy.shape[0]
+    distances = np.empty((num_vehicles, num_vehicles))
+    path_losses = np.empty((num_vehicles, num_vehicles))
+    for i in prange(num_vehicles):
+        for j in range(num_vehicles):
+            distance = np.hypot(xy[i, 0] - xy[j, 0], xy[i, 1] - xy[j, 1])
+            distances[i, j] = distance
+            if distance > 1:
+                path_losses[i, j] = V2V_PATH_LOSS_OFFSET + 16.7 * np.log10(distance)
+            else:
+                path_losses[i, j] = 40.0
+    return distances, path_losses
+
+def v2v_path_loss(positions):
+    """全車両ペアの距離 (V, V) とV2Vパスロス [dB] (V, V) を計算"""
+    xy = np.asarray(positions, dtype=np.float64)
+    if NUMBA_AVAILABLE:
+        return _v2v_path_loss_kernel(xy)
+    
+    # numbaが無い場合は全ペアをブロードキャストで一括計算
+    offsets = xy[:, None, :] - xy[None, :, :]
+    distances = np.hypot(offsets[..., 0], offsets[..., 1])
+    with np.errstate(divide='ignore'):
+        path_losses = np.where(
+            distances > 1,
+            V2V_PATH_LOSS_OFFSET + 16.7 * np.log10(distances),
+            40.0
+        )
+    return distances, path_losses
+
 print("=== V2V Distance and Path Loss Analysis ===")
 print()
 
+initial_positions = np.array(vehicles_pos)
+velocities = np.array(vehicles_vel)
+
 for step in [0, 10, 19]:
     print(f"Time Step {step}:")
     
-    # Calculate positions at this step
-    positions = []
-    for i, pos in enumerate(vehicles_pos):
-        if i == 0:  # vehicle_1: vel = [6, 0]
-            x = pos[0] + 6 * step
-            y = pos[1]
-        elif i == 1:  # vehicle_2: vel = [-4, 0]
-            x = pos[0] - 4 * step
-            y = pos[1]
-        elif i == 2:  # vehicle_3: vel = [0, 5]
-            x = pos[0]
-            y = pos[1] + 5 * step
-        elif i == 3:  # vehicle_4: vel = [0, -4]
-            x = pos[0]
-            y = pos[1] - 4 * step
-        
-        # Keep within bounds
-        x = max(10, min(290, x))
-        y = max(10, min(290, y))
-        positions.append([x, y])
+    # Calculate positions at this step (keep within bounds)
+    positions = np.clip(initial_positions + velocities * step, 10, 290).tolist()
     
     print(f"  Vehicle positions: {positions}")
     
     # Calculate V2V distances and path loss
-    for i in range(4):
-        for j in range(4):
+    distances, path_losses = v2v_path_loss(positions)
+    
+    for i in range(len(positions)):
+        for j in range(len(positions)):
             if i != j:
-                distance = np.sqrt(
-                    (positions[i][0] - positions[j][0])**2 + 
-                    (positions[i][1] - positions[j][1])**2
-                )
-                
-                # V2V path loss calculation
-                if distance > 1:
-                    path_loss_db = 38.77 + 16.7 * np.log10(distance) + 18.2 * np.log10(5.9)
-                else:
-                    path_loss_db = 40.0
-                
-                print(f"  vehicle_{i+1} -> vehicle_{j+1}: {distance:.1f}m -> {path_loss_db:.1f}dB")
+                print(f"  vehicle_{i+1} -> vehicle_{j+1}: {distances[i, j]:.1f}m -> {path_losses[i, j]:.1f}dB")
     
     print()
\ No newline at end of file
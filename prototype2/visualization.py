@@ -3,9 +3,35 @@ V2X Simulation Visualization Tool
 6台の車両シナリオ用
 """
 
+import base64
 import json
 import os
-from typing import Dict, Any, List
+from array import array
+from typing import Dict, Any, Iterable, List, Tuple
+import numpy as np
+from results_io import iter_simulation_steps
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# パスロスの区分の境界 [dB]（<80: 良好, <100: 中程度, <120: 不良, それ以上: 非常に不良）
+# HTML側の描画ループで分岐しないよう、区分の番号を変換時にまとめて計算しておく
+PATH_LOSS_BUCKET_EDGES = (80, 100, 120)
+
+def _dumps(obj: Any) -> bytes:
+    """インデントなしのコンパクトなJSONバイト列に変換（orjson、ujson、標準jsonの順に使えるものを使う）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    if ujson is not None:
+        return ujson.dumps(obj).encode()
+    return json.dumps(obj, separators=(',', ':')).encode()
 
 class V2XVisualizer:
     """V2Xシミュレーション用ビジュアライザー"""
@@ -14,66 +40,125 @@ class V2XVisualizer:
         self.world_size = [300, 300]
         
     def convert_results_to_visualization(self, results_file: str, output_file: str = "visualization/data.json"):
-        """シミュレーション結果をvisualization形式に変換"""
+        """シミュレーション結果をvisualization形式に変換
+        
+        ijsonがあれば結果ファイル全体は展開せず、ステップ単位で読み込みながら変換する
+        """
+        return self._convert_steps(iter_simulation_steps(results_file), output_file)
+    
+    def convert_simulation_data_to_visualization(self, results: Dict[str, Any], output_file: str = "visualization/data.json"):
+        """run_simulationの戻り値をvisualization形式に変換
+        
+        ステップをメモリ上に持っている場合は結果ファイルを読み直さずにそのまま変換し、
+        ファイルへ書き出した場合（output_path指定時）はそのファイルからステップ単位で読み込む
+        """
+        if "simulation_data" in results:
+            steps = results["simulation_data"]
+        else:
+            steps = iter_simulation_steps(results["output_path"])
+        return self._convert_steps(steps, output_file)
+    
+    def _convert_steps(self, steps: Iterable[Dict[str, Any]], output_file: str):
+        """シミュレーションのステップを1回だけ走査してvisualization形式で書き出す"""
         
         try:
-            # Load simulation results
-            with open(results_file, 'r') as f:
-                simulation_data = json.load(f)
-            
-            visualization_data = []
-            
-            for step_data in simulation_data["simulation_data"]:
-                frame = {
-                    "time": step_data["time_step"],
-                    "world_size": self.world_size,
-                    "vehicles": [],
-                    "base_stations": [
-                        {
-                            "id": "bs_1",
-                            "position": [80, 80]
-                        },
-                        {
-                            "id": "bs_2", 
-                            "position": [220, 180]
-                        }
-                    ],
-                    "buildings": [
-                        {
-                            "id": "building_1",
-                            "position": [150, 120],
-                            "size": [60, 40, 25]
-                        }
-                    ],
-                    "path_losses": []
-                }
-                
-                # Add vehicles with current positions
-                for vehicle_id, position in step_data["vehicle_positions"].items():
-                    frame["vehicles"].append({
-                        "id": vehicle_id,
-                        "position": [position[0], position[1]]  # x, y only for 2D visualization
-                    })
-                
-                # Add path loss data
-                for pair in step_data["path_loss_pairs"]:
-                    frame["path_losses"].append({
-                        "source": pair["source"],
-                        "target": pair["target"],
-                        "value": pair["path_loss_db"]
-                    })
-                
-                visualization_data.append(frame)
+            # ワールドサイズ・基地局・建物は静的なので、フレームごとではなく "static" に1回だけ書き出す
+            static_data = {
+                "world_size": self.world_size,
+                "base_stations": [
+                    {
+                        "id": "bs_1",
+                        "position": [80, 80]
+                    },
+                    {
+                        "id": "bs_2", 
+                        "position": [220, 180]
+                    }
+                ],
+                "buildings": [
+                    {
+                        "id": "building_1",
+                        "position": [150, 120],
+                        "size": [60, 40, 25]
+                    }
+                ]
+            }
             
-            # Save visualization data
-            os.makedirs("visualization", exist_ok=True)
-            with open(output_file, 'w') as f:
-                json.dump(visualization_data, f, indent=2)
+            # フレーム自体は書き出したら保持せず、サマリーに必要な値だけを逐次更新する
+            num_frames = 0
+            vehicle_ids = []     # 最初のフレームの車両ID
+            vehicle_tracks = {}  # 車両ID -> [最初の位置, 最後の位置, 出現フレーム数]
+            
+            # パスロスは最後に全フレーム分をまとめてエンコードするため、(フレーム, ペア) の位置と値だけを
+            # Pythonオブジェクトではなく型付き配列（1件あたり24バイト）に集め、全フレームを書き終えてから行列にまとめる
+            pair_index = {}
+            rows, columns, values = array('q'), array('q'), array('d')
+            
+            # フレームは作った端から書き出し、出力全体を1つの文字列にまとめない
+            # （ブラウザが読むだけのファイルなので、インデントなしのコンパクトな形式で書き出す）
+            os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+            # 入力を最後まで読めた場合だけ差し替えるよう、同じディレクトリの一時ファイルに書いてから置き換える
+            # （結果ファイルが壊れていて途中で失敗しても、前回のdata.jsonはそのまま残る）
+            tmp_file = output_file + ".tmp"
+            try:
+                with open(tmp_file, 'wb', buffering=1 << 20) as f:
+                    f.write(b'{"static":' + _dumps(static_data) + b',"frames":[')
+                    for t, step_data in enumerate(steps):
+                        # Add vehicles with current positions (x, y only for 2D visualization)
+                        frame = {
+                            "time": step_data["time_step"],
+                            "vehicles": [
+                                {"id": vehicle_id, "position": [position[0], position[1]]}
+                                for vehicle_id, position in step_data["vehicle_positions"].items()
+                            ]
+                        }
+                        
+                        # Track vehicle movement for the summary
+                        for vehicle in frame["vehicles"]:
+                            track = vehicle_tracks.get(vehicle["id"])
+                            if track is None:
+                                vehicle_tracks[vehicle["id"]] = [vehicle["position"], vehicle["position"], 1]
+                            else:
+                                track[1] = vehicle["position"]
+                                track[2] += 1
+                        if num_frames == 0:
+                            vehicle_ids = [vehicle["id"] for vehicle in frame["vehicles"]]
+                        
+                        # Collect path loss data
+                        for pair in step_data["path_loss_pairs"]:
+                            rows.append(t)
+                            columns.append(pair_index.setdefault((pair["source"], pair["target"]), len(pair_index)))
+                            values.append(pair["path_loss_db"])
+                        
+                        # Write the frame as the next element of the frames array
+                        if num_frames:
+                            f.write(b',')
+                        f.write(_dumps(frame))
+                        num_frames += 1
+                    
+                    # 全フレームのパスロスの行列（そのフレームに無いペアはNaN）
+                    path_loss_matrix = np.full((num_frames, len(pair_index)), np.nan)
+                    path_loss_matrix[np.frombuffer(rows, dtype=np.int64), np.frombuffer(columns, dtype=np.int64)] = np.frombuffer(values, dtype=np.float64)
+                    path_loss_pairs = list(pair_index)
+                    
+                    # ブラウザが値を1つずつJSONとして解析しないよう、float32のバイナリをbase64で埋め込む
+                    # 区分の番号も1回の np.digitize でまとめて求め、uint8のバイナリで埋め込む
+                    path_losses = {
+                        "pairs": path_loss_pairs,
+                        "shape": list(path_loss_matrix.shape),
+                        "values_b64": base64.b64encode(path_loss_matrix.astype('<f4').tobytes()).decode('ascii'),
+                        "buckets_b64": base64.b64encode(np.digitize(path_loss_matrix, PATH_LOSS_BUCKET_EDGES).astype(np.uint8).tobytes()).decode('ascii')
+                    }
+                    f.write(b'],"path_losses":' + _dumps(path_losses) + b'}')
+                os.replace(tmp_file, output_file)
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
             
             print(f"✅ Visualization data saved to {output_file}")
             
             # Print summary statistics
-            self._print_visualization_summary(visualization_data)
+            self._print_visualization_summary(num_frames, vehicle_ids, vehicle_tracks, static_data, path_loss_pairs, path_loss_matrix)
             
             return True
             
@@ -81,52 +166,42 @@ class V2XVisualizer:
             print(f"❌ Failed to convert results: {e}")
             return False
     
-    def _print_visualization_summary(self, data: List[Dict[str, Any]]):
-        """ビジュアライゼーションデータのサマリーを表示"""
-        if not data:
+    def _print_visualization_summary(self, num_frames: int, vehicle_ids: List[str], vehicle_tracks: Dict[str, list],
+                                     static_data: Dict[str, Any], path_loss_pairs: List[Tuple[str, str]], path_loss_matrix: np.ndarray):
+        """ビジュアライゼーションデータのサマリーを表示
+        
+        vehicle_tracksは変換中に集めた 車両ID -> [最初の位置, 最後の位置, 出現フレーム数]
+        """
+        if not num_frames:
             return
         
         print(f"\n=== Visualization Data Summary ===")
-        print(f"Time steps: {len(data)}")
-        print(f"Vehicles: {len(data[0]['vehicles'])}")
-        print(f"Base stations: {len(data[0]['base_stations'])}")
-        print(f"Buildings: {len(data[0]['buildings'])}")
+        print(f"Time steps: {num_frames}")
+        print(f"Vehicles: {len(vehicle_ids)}")
+        print(f"Base stations: {len(static_data['base_stations'])}")
+        print(f"Buildings: {len(static_data['buildings'])}")
         
         # Analyze path loss variations
         print(f"\n=== Vehicle Movement Analysis ===")
-        for vehicle in data[0]['vehicles']:
-            vehicle_id = vehicle['id']
-            positions = []
-            
-            for frame in data:
-                for v in frame['vehicles']:
-                    if v['id'] == vehicle_id:
-                        positions.append(v['position'])
-                        break
-            
-            if len(positions) >= 2:
-                start_pos = positions[0]
-                end_pos = positions[-1]
-                distance_moved = ((end_pos[0] - start_pos[0])**2 + (end_pos[1] - start_pos[1])**2)**0.5
-                print(f"{vehicle_id}: [{start_pos[0]:.1f}, {start_pos[1]:.1f}] → [{end_pos[0]:.1f}, {end_pos[1]:.1f}] (moved {distance_moved:.1f}m)")
+        # 最初のフレームの車両ごとに、最初と最後に現れた位置から移動距離をまとめて計算
+        moved_ids = [vehicle_id for vehicle_id in vehicle_ids if vehicle_tracks[vehicle_id][2] >= 2]
+        start_pos = np.array([vehicle_tracks[vehicle_id][0] for vehicle_id in moved_ids], dtype=np.float64).reshape(-1, 2)
+        end_pos = np.array([vehicle_tracks[vehicle_id][1] for vehicle_id in moved_ids], dtype=np.float64).reshape(-1, 2)
+        distances_moved = np.hypot(end_pos[:, 0] - start_pos[:, 0], end_pos[:, 1] - start_pos[:, 1])
+        
+        # 値はまとめてPythonのfloatに変換し、%演算子で整形する
+        for vehicle_id, (start_x, start_y), (end_x, end_y), moved in zip(moved_ids, start_pos.tolist(), end_pos.tolist(), distances_moved.tolist()):
+            print("%s: [%.1f, %.1f] → [%.1f, %.1f] (moved %.1fm)" % (vehicle_id, start_x, start_y, end_x, end_y, moved))
         
         # Path loss analysis
         print(f"\n=== Path Loss Variation Analysis ===")
-        path_loss_stats = {}
-        
-        for frame in data:
-            for loss_data in frame['path_losses']:
-                pair_key = f"{loss_data['source']}-{loss_data['target']}"
-                if pair_key not in path_loss_stats:
-                    path_loss_stats[pair_key] = []
-                path_loss_stats[pair_key].append(loss_data['value'])
+        # (フレーム, ペア) の行列からペアごとの最小・最大をまとめて求める（そのフレームに無いペアのNaNは除外）
+        min_losses = np.nanmin(path_loss_matrix, axis=0)
+        max_losses = np.nanmax(path_loss_matrix, axis=0)
         
-        for pair, losses in path_loss_stats.items():
-            if losses:
-                min_loss = min(losses)
-                max_loss = max(losses)
-                variation = max_loss - min_loss
-                print(f"{pair}: {min_loss:.1f} - {max_loss:.1f} dB (variation: {variation:.1f} dB)")
+        for (source, target), min_loss, max_loss in zip(path_loss_pairs, min_losses.tolist(), max_losses.tolist()):
+            variation = max_loss - min_loss
+            print("%s-%s: %.1f - %.1f dB (variation: %.1f dB)" % (source, target, min_loss, max_loss, variation))
     
     def create_html_visualization(self, data_file: str = "visualization/data.json"):
         """HTMLビジュアライゼーションファイルを作成"""
@@ -229,11 +304,25 @@ class V2XVisualizer:
 
     <script>
         let simulationData = [];
+        let staticData = {};
+        
+        // Path losses of every frame, decoded once from data.json (frame-major, one slot per pair)
+        let pathLossPairs = [];
+        let pathLossValues = new Float32Array(0);
+        let pathLossBuckets = new Uint8Array(0);
         let currentFrame = 0;
         let isPlaying = false;
         let animationSpeed = 1.0;
         let lastTime = 0;
         let isNetworkView = false;
+        
+        // [color, line width] per path loss bucket (<80, <100, <120, >=120 dB)
+        const EDGE_STYLES = [
+            ['#00ff00', 4], // Green for good signal
+            ['#ffaa00', 3], // Orange for medium signal
+            ['#ff4444', 2], // Red for poor signal
+            ['#888888', 1]  // Gray for very poor/no signal
+        ];
 
         const canvas = document.getElementById('simulationCanvas');
         const ctx = canvas.getContext('2d');
@@ -247,7 +336,11 @@ class V2XVisualizer:
         fetch('data.json')
             .then(response => response.json())
             .then(data => {
-                simulationData = data;
+                staticData = data.static;
+                pathLossPairs = data.path_losses.pairs;
+                pathLossValues = new Float32Array(decodeBase64(data.path_losses.values_b64).buffer);
+                pathLossBuckets = decodeBase64(data.path_losses.buckets_b64);
+                simulationData = data.frames;
                 currentFrame = 0;
                 drawFrame();
                 drawNetworkGraph();
@@ -259,11 +352,40 @@ class V2XVisualizer:
                 showSampleFrame();
             });
 
+        function decodeBase64(b64) {
+            const binary = atob(b64);
+            const bytes = new Uint8Array(binary.length);
+            for (let i = 0; i < binary.length; i++) {
+                bytes[i] = binary.charCodeAt(i);
+            }
+            return bytes;
+        }
+
+        function forEachPathLoss(frameIndex, callback) {
+            const numPairs = pathLossPairs.length;
+            const offset = frameIndex * numPairs;
+            for (let k = 0; k < numPairs; k++) {
+                const value = pathLossValues[offset + k];
+                // NaN marks a pair that is missing from this frame
+                if (Number.isNaN(value)) continue;
+                callback(pathLossPairs[k][0], pathLossPairs[k][1], value, pathLossBuckets[offset + k]);
+            }
+        }
+
         function showSampleFrame() {
             // Sample data for testing
+            staticData = {
+                world_size: [300, 300],
+                base_stations: [
+                    {id: "bs_1", position: [80, 80]},
+                    {id: "bs_2", position: [220, 180]}
+                ],
+                buildings: [
+                    {id: "building_1", position: [150, 120], size: [60, 40, 25]}
+                ]
+            };
             simulationData = [{
                 time: 0,
-                world_size: [300, 300],
                 vehicles: [
                     {id: "vehicle_1", position: [50, 50]},
                     {id: "vehicle_2", position: [100, 100]},
@@ -271,16 +393,9 @@ class V2XVisualizer:
                     {id: "vehicle_4", position: [200, 150]},
                     {id: "vehicle_5", position: [80, 200]},
                     {id: "vehicle_6", position: [180, 30]}
-                ],
-                base_stations: [
-                    {id: "bs_1", position: [80, 80]},
-                    {id: "bs_2", position: [220, 180]}
-                ],
-                buildings: [
-                    {id: "building_1", position: [150, 120], size: [60, 40, 25]}
-                ],
-                path_losses: []
+                ]
             }];
+            pathLossPairs = [];
             drawFrame();
         }
 
@@ -288,7 +403,7 @@ class V2XVisualizer:
             if (simulationData.length === 0) return;
             
             const frame = simulationData[currentFrame];
-            const worldSize = frame.world_size || [300, 300];
+            const worldSize = staticData.world_size || [300, 300];
             
             // Clear canvas
             ctx.clearRect(0, 0, canvas.width, canvas.height);
@@ -299,7 +414,7 @@ class V2XVisualizer:
             
             // Draw buildings
             ctx.fillStyle = '#8B4513';
-            frame.buildings?.forEach(building => {
+            staticData.buildings?.forEach(building => {
                 const x = building.position[0] * scaleX;
                 const y = building.position[1] * scaleY;
                 const w = building.size[0] * scaleX;
@@ -316,7 +431,7 @@ class V2XVisualizer:
             
             // Draw base stations
             ctx.fillStyle = '#FF6B6B';
-            frame.base_stations?.forEach(bs => {
+            staticData.base_stations?.forEach(bs => {
                 const x = bs.position[0] * scaleX;
                 const y = bs.position[1] * scaleY;
                 
@@ -371,8 +486,9 @@ class V2XVisualizer:
             const centerY = networkCanvas.height / 2;
             const radius = 200;
             
-            // Calculate node positions
-            const allNodes = [...frame.vehicles, ...frame.base_stations];
+            // Calculate node positions (vehicles come first, so the index tells the node type)
+            const allNodes = [...frame.vehicles, ...staticData.base_stations];
+            const numVehicles = frame.vehicles.length;
             const nodePositions = {};
             
             allNodes.forEach((node, index) => {
@@ -380,34 +496,18 @@ class V2XVisualizer:
                 nodePositions[node.id] = {
                     x: centerX + radius * Math.cos(angle),
                     y: centerY + radius * Math.sin(angle),
-                    type: frame.vehicles.find(v => v.id === node.id) ? 'vehicle' : 'base_station'
+                    type: index < numVehicles ? 'vehicle' : 'base_station'
                 };
             });
             
             // Draw edges (connections with path loss)
-            frame.path_losses?.forEach(loss => {
-                const source = nodePositions[loss.source];
-                const target = nodePositions[loss.target];
+            forEachPathLoss(currentFrame, (sourceId, targetId, pathLoss, bucket) => {
+                const source = nodePositions[sourceId];
+                const target = nodePositions[targetId];
                 
                 if (source && target) {
-                    // Color based on path loss value
-                    const pathLoss = loss.value;
-                    let edgeColor;
-                    let lineWidth;
-                    
-                    if (pathLoss < 80) {
-                        edgeColor = '#00ff00'; // Green for good signal
-                        lineWidth = 4;
-                    } else if (pathLoss < 100) {
-                        edgeColor = '#ffaa00'; // Orange for medium signal
-                        lineWidth = 3;
-                    } else if (pathLoss < 120) {
-                        edgeColor = '#ff4444'; // Red for poor signal
-                        lineWidth = 2;
-                    } else {
-                        edgeColor = '#888888'; // Gray for very poor/no signal
-                        lineWidth = 1;
-                    }
+                    // Color based on the path loss bucket precomputed in data.json
+                    const [edgeColor, lineWidth] = EDGE_STYLES[bucket];
                     
                     // Draw connection line
                     networkCtx.strokeStyle = edgeColor;
@@ -518,12 +618,12 @@ class V2XVisualizer:
             
             // Update path loss stats
             let pathLossHTML = '';
-            frame.path_losses?.forEach(loss => {
-                const lossClass = loss.value > 100 ? 'high-loss' : 'low-loss';
+            forEachPathLoss(currentFrame, (source, target, value) => {
+                const lossClass = value > 100 ? 'high-loss' : 'low-loss';
                 pathLossHTML += `
                     <div class="path-loss-item">
-                        <span>${loss.source} → ${loss.target}</span>
-                        <span class="${lossClass}">${loss.value.toFixed(1)} dB</span>
+                        <span>${source} → ${target}</span>
+                        <span class="${lossClass}">${value.toFixed(1)} dB</span>
                     </div>
                 `;
             });